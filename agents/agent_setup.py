@@ -1,17 +1,38 @@
 #agentes/agent_setup.py
 import logging
-from typing import List
-from functools import partial
+import os
+import re
+import string
+import time
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from functools import lru_cache, partial
 import asyncio
-import pytz
 from datetime import datetime
-
-from langchain.agents import Tool, AgentExecutor, create_openai_functions_agent
-from langchain.prompts import PromptTemplate
-from langchain_core.tools import BaseTool
+from zoneinfo import ZoneInfo
+
+from langchain.agents import Tool, AgentExecutor, create_tool_calling_agent
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import (
+    ChatPromptTemplate,
+    HumanMessagePromptTemplate,
+    MessagesPlaceholder,
+    StringPromptTemplate,
+)
+from langchain_core.exceptions import OutputParserException
+from langchain_core.tools import BaseTool, StructuredTool
+from pydantic import BaseModel, Field
 
 from utils.conversation_manager import conversation_manager
-from knowledge_base.neogames_knowledge import NeoGamesKnowledge, KnowledgeSource
+from utils.semantic_cache import SemanticCache
+from utils.ttl_cache import TTLCache
+from knowledge_base.neogames_knowledge import (
+    NeoGamesKnowledge,
+    KnowledgeSource,
+    NOT_INITIALIZED_MESSAGE,
+    QUERY_ERROR_MESSAGE,
+)
 from knowledge_base.neogames_rankings import (
     NeoGamesRankings,
     CLASS_MAPPING,
@@ -21,18 +42,39 @@ from knowledge_base.neogames_rankings import (
     RANKING_TYPE_WAR
 )
 
-from services.llm import llm_openai
-from services.llm import llm_claude, llm_manager
+from services.llm import llm_manager
 
 logging.getLogger("unstructured.trace").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# Fuso de Brasília e meses em português (evita depender do locale no strftime("%B"))
+_BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
+_MONTHS_PT = (
+    "janeiro", "fevereiro", "março", "abril", "maio", "junho",
+    "julho", "agosto", "setembro", "outubro", "novembro", "dezembro"
+)
+
+# Último minuto formatado: (minuto desde a época, texto)
+_datetime_cache: Tuple[int, str] = (-1, "")
+
+def _current_datetime_text() -> str:
+    """Data e hora de Brasília por extenso, recalculada só quando o minuto muda."""
+    global _datetime_cache
+    now_ts = time.time()
+    minute = int(now_ts // 60)
+    if _datetime_cache[0] != minute:
+        now = datetime.fromtimestamp(now_ts, _BRAZIL_TZ)
+        _datetime_cache = (
+            minute,
+            f"{now.day:02d} de {_MONTHS_PT[now.month - 1]} de {now.year} às {now.hour:02d}:{now.minute:02d}"
+        )
+    return _datetime_cache[1]
+
 SYSTEM_PROMPT = """[IDENTIDADE]
 Role: Veterano lvl 200 do NeoGames BR
 Background: Player desde o CBT (Closed Beta Test)
 Experiência: Membro de guild top, ex-líder de wars, expert em todas as classes
 Servidor: https://www.neogames.online
-Data e hora atual: {current_datetime}
 
 [LINGUAGEM_OBRIGATÓRIA]
 Termos_Básicos:
@@ -84,7 +126,7 @@ Tools disponíveis:
   * "war_roles" - portadores e guardiões
   * "war_weekly" - ranking semanal de guerra
   * "power_ranking" - ranking geral de poder
-  * rankings específicos por classe (power_ranking_gu, power_ranking_ma, etc)
+  * "power_ranking_class" - ranking de poder de uma classe (class_abbr: gu, ma, etc)
 
 [FLUXO_RESPOSTA]
 1. Identifique o tipo de dúvida
@@ -93,6 +135,7 @@ Tools disponíveis:
 4. Adicione dicas extras relacionando diferentes aspectos
 5. Insira links relevantes
 6. Termine com gíria do server
+- Quando precisar de múltiplas informações independentes (ex: ranking de guild + war_weekly), emita TODAS as tool_calls numa mesma resposta.
 
 [RESTRIÇÕES]
 NÃO_FAZER:
@@ -132,12 +175,275 @@ Resposta: "Na real todas tão MT bravas no PVP do server, mas EA (Espadachin Arc
 - Seja AMIGÁVEL mas HARDCORE
 """
 
+# Instrução para enfatizar o uso da pergunta completa nas tools
+_TOOL_PROMPT = """Para encontrar as informações mais precisas:
+        1. Selecione a ferramenta mais apropriada
+        2. Use a pergunta COMPLETA do usuário
+        3. NÃO resuma ou modifique a pergunta
+        4. NÃO extraia apenas palavras-chave"""
+
+_CONTEXT_TEMPLATE = """
+        Histórico da Conversa:
+        {history}
+        
+        Solicitação Atual: {input}
+        
+        Contexto Adicional:
+        - Data/Hora: {current_datetime}
+        """
+
+class PrecompiledPromptTemplate(StringPromptTemplate):
+    """
+    Prompt cujo template é quebrado em (texto fixo, variável) uma única vez.
+    O format só concatena as partes, sem varrer o template a cada mensagem.
+    """
+    parts: Tuple[Tuple[str, Optional[str]], ...]
+
+    @classmethod
+    def from_template(cls, template: str) -> "PrecompiledPromptTemplate":
+        parts = tuple(
+            (literal, field_name)
+            for literal, field_name, _, _ in string.Formatter().parse(template)
+        )
+        input_variables = list(dict.fromkeys(name for _, name in parts if name))
+        return cls(parts=parts, input_variables=input_variables)
+
+    def format(self, **kwargs: Any) -> str:
+        kwargs = self._merge_partial_and_user_variables(**kwargs)
+        return "".join(
+            literal + str(kwargs[name]) if name else literal
+            for literal, name in self.parts
+        )
+
+    @property
+    def _prompt_type(self) -> str:
+        return "precompiled"
+
+# Prefixo estático (instruções das tools + persona): idêntico byte a byte em todas
+# as chamadas, para aproveitar o cache de prefixo do provedor
+_STATIC_SYSTEM_PROMPT = _TOOL_PROMPT + "\n\n" + SYSTEM_PROMPT
+
+def _build_prompt(provider: str = "openai") -> ChatPromptTemplate:
+    """
+    Monta o prompt do agente: system estático, parte dinâmica na mensagem
+    do usuário e o scratchpad das tools como mensagens.
+    """
+    if provider == "claude":
+        # Anthropic só cacheia o prefixo marcado explicitamente
+        system = SystemMessage(content=[{
+            "type": "text",
+            "text": _STATIC_SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"}
+        }])
+    else:
+        # OpenAI cacheia prefixos repetidos automaticamente
+        system = SystemMessage(content=_STATIC_SYSTEM_PROMPT)
+
+    return ChatPromptTemplate.from_messages([
+        system,
+        HumanMessagePromptTemplate(
+            prompt=PrecompiledPromptTemplate.from_template(_CONTEXT_TEMPLATE)
+        ),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ])
+
+_PROMPT = _build_prompt("openai")
+
+# Modelo OpenAI compartilhado por todas as instâncias do agente
+_OPENAI_LLM = llm_manager.get_llm("openai")
+
+# Logs detalhados do AgentExecutor só quando explicitamente habilitados
+_AGENT_VERBOSE = os.getenv("AGENT_VERBOSE") == "1"
+
+# Observação devolvida ao agente quando a saída do LLM não pode ser interpretada
+_PARSING_ERROR_FALLBACK = (
+    "Formato de resposta inválido. Responda diretamente ao usuário "
+    "ou chame uma das ferramentas disponíveis."
+)
+
+def _handle_parsing_error(error: OutputParserException) -> str:
+    """Retorna a observação fixa sem reformatar a exceção a cada saída malformada."""
+    logger.debug(f"Saída do LLM não interpretável: {error}")
+    return _PARSING_ERROR_FALLBACK
+
+# Especificações das tools, montadas uma única vez no import.
+# Knowledge: (nome, fontes, descrição)
+_KNOWLEDGE_TOOL_SPECS = (
+    (
+        "news_systems",
+        (KnowledgeSource.NEWS, KnowledgeSource.SYSTEM),
+        "Usa para ver notícias recentes e informações sobre sistemas/mecânicas do jogo"
+    ),
+    (
+        "vip_shop_info",
+        (KnowledgeSource.VIP, KnowledgeSource.SHOP, KnowledgeSource.RECHARGE),
+        "Usa para informações sobre VIP, Loja de Cash, Recarga/Docao/Donate/Recarregar"
+    ),
+    (
+        "faq_help",
+        (KnowledgeSource.FAQ, KnowledgeSource.DOWNLOAD),
+        "Usa para ver perguntas frequentes e ajuda com download/instalação"
+    ),
+)
+
+# Rankings: (nome, argumentos da query, descrição)
+_RANKING_TOOL_SPECS = (
+    (
+        "guild_ranking",
+        {"ranking_types": [RANKING_TYPE_GUILD]},
+        "Usa pra ver o ranking das guilds."
+    ),
+    (
+        "memorial_ranking",
+        {"ranking_types": [RANKING_TYPE_MEMORIAL]},
+        "Usa pra ver o ranking do memorial e sempre retorne todos os players que estão com a posse."
+    ),
+    (
+        "war_roles",
+        {"ranking_types": [RANKING_TYPE_WAR], "query_type": "roles"},
+        "Usa pra ver os Portadores e Guardiões atuais de cada nação."
+    ),
+    (
+        "war_weekly",
+        {"ranking_types": [RANKING_TYPE_WAR], "query_type": "weekly"},
+        "Usa pra ver o ranking semanal de guerra com pontuações e abates."
+    ),
+    (
+        "power_ranking",
+        {"ranking_types": [RANKING_TYPE_POWER]},
+        "Usa pra ver o ranking geral de poder dos players (sem filtro de classe)."
+    ),
+)
+
+# Ranking de poder por classe: uma única tool parametrizada pela abreviação da classe
+_POWER_CLASS_TOOL_NAME = "power_ranking_class"
+
+PowerRankingClass = Enum(
+    "PowerRankingClass",
+    {info['short_lower']: info['short_lower'] for info in CLASS_MAPPING.values()},
+    type=str
+)
+
+class PowerRankingClassInput(BaseModel):
+    """Argumentos da tool de ranking de poder por classe."""
+    question: str = Field(description="Pergunta COMPLETA do usuário")
+    class_abbr: PowerRankingClass = Field(description="Abreviação da classe")
+
+_POWER_CLASS_TOOL_DESCRIPTION = (
+    "Usa pra ver o ranking de poder de uma classe específica. class_abbr: "
+    + ", ".join(
+        f"{info['short_lower']} = {info['name_pt']}" for info in CLASS_MAPPING.values()
+    )
+    + "."
+)
+
+# Roteador de intenções: mensagens curtas que pedem exatamente um ranking
+# vão direto pra tool, sem passar pelo LLM. Só rankings: a saída já vem
+# formatada pro usuário (as tools de conhecimento devolvem trechos brutos).
+_CLASS_ALIASES = {
+    alias: info['short_lower']
+    for info in CLASS_MAPPING.values()
+    for alias in (info['name_pt'].lower(), info['name'].lower(), info['short_lower'])
+}
+_RANK = r"(?:ranking|rank|top)\s+(?:d[aeo]s?\s+)?"
+
+_INTENT_ROUTES: Tuple[Tuple["re.Pattern[str]", str], ...] = (
+    (re.compile(rf"^{_RANK}guild(?:a)?s?$"), "guild_ranking"),
+    (re.compile(rf"^{_RANK}memorial$"), "memorial_ranking"),
+    (re.compile(rf"^{_RANK}(?:war|guerra)(?:\s+semanal)?$"), "war_weekly"),
+    (re.compile(r"^(?:quem\s+s[aã]o\s+(?:os\s+)?)?(?:portadores?|guardi[aãoõ]es|guardi[aã]o)"
+                r"(?:\s+e\s+(?:portadores?|guardi[aãoõ]es|guardi[aã]o))?$"), "war_roles"),
+    (re.compile(rf"^{_RANK}(?:poder|power)$"), "power_ranking"),
+    (re.compile(
+        rf"^{_RANK}(?:(?:poder|power)\s+(?:d[aeo]s?\s+)?)?(?P<cls>"
+        + "|".join(re.escape(alias) for alias in sorted(_CLASS_ALIASES, key=len, reverse=True))
+        + r")s?$"
+    ), _POWER_CLASS_TOOL_NAME),
+)
+
+def _route_intent(message: str) -> Optional[Tuple[str, Optional[str]]]:
+    """Retorna (tool, classe) se a mensagem for um pedido direto de ranking."""
+    text = " ".join(message.lower().split()).strip(" ?!.")
+    if len(text) > 60:
+        return None
+    for pattern, tool_name in _INTENT_ROUTES:
+        match = pattern.match(text)
+        if match:
+            class_alias = match.groupdict().get("cls")
+            return tool_name, _CLASS_ALIASES.get(class_alias) if class_alias else None
+    return None
+
+# Saída do AgentExecutor quando para por limite de iterações/tempo (early_stopping_method="force")
+_AGENT_STOPPED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+
+# Contagem de chamadas (tool, pergunta) da execução atual do agente
+_run_tool_calls: ContextVar[Optional[Dict[Tuple[str, str], int]]] = ContextVar(
+    "run_tool_calls", default=None
+)
+
+# Tools cujos dados mudam com frequência: respostas que passaram por elas não vão pro cache
+_VOLATILE_TOOLS = frozenset(
+    name for name, _, _ in _RANKING_TOOL_SPECS
+) | {_POWER_CLASS_TOOL_NAME, "news_systems"}
+
+# Perguntas sobre dados voláteis nem consultam o cache de respostas
+_VOLATILE_QUERY_RE = re.compile(
+    r"rank|guild|guilda|memorial|war|guerra|poder|power|portador|guardi|"
+    r"not[ií]cia|news|evento|hoje|agora|semana",
+    re.IGNORECASE
+)
+
+# Respostas das bases que indicam falha/base ainda vazia: nunca vão para o cache das tools
+_UNCACHEABLE_TOOL_RESULTS = frozenset({QUERY_ERROR_MESSAGE, NOT_INITIALIZED_MESSAGE})
+
+def _is_cacheable_tool_result(result: str) -> bool:
+    """Só resultados com dados: vazio (ranking sem arquivo), erros e sentinelas ficam de fora."""
+    return (
+        bool(result and result.strip())
+        and result not in _UNCACHEABLE_TOOL_RESULTS
+        and not result.startswith("Erro")
+    )
+
+# Respostas de ranking sem dados: pedidos roteados caem no agente em vez de repassá-las
+_NO_DATA_PREFIXES = ("Nenhum dado encontrado", "Tipo de ranking não reconhecido")
+
+class _ToolNotice(str):
+    """
+    Texto gerado pelo próprio _run_tool (timeout, consulta repetida), e não pela base:
+    serve de orientação ao modelo, mas nunca é entregue ao usuário como resposta.
+    """
+
+def _is_direct_answer(result: str) -> bool:
+    """Resultado de tool que pode ir direto ao usuário num pedido roteado."""
+    return (
+        not isinstance(result, _ToolNotice)
+        and _is_cacheable_tool_result(result)
+        and not result.startswith(_NO_DATA_PREFIXES)
+    )
+
 class AgentManager:
     def __init__(self):
         self.neogames_knowledge = NeoGamesKnowledge()
         self.neogames_rankings = NeoGamesRankings()
-        self.max_iterations = 5
+        self.max_iterations = 3
         self.max_tool_repeats = 2
+        self.tool_timeout = 8  # segundos por consulta de tool
+        self.max_execution_time = 25  # segundos para o executor inteiro
+        self.request_timeout = 30  # limite absoluto do process_message
+
+        # Consultas em andamento, compartilhadas entre chamadas idênticas
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+        # Limita quantas consultas rodam ao mesmo tempo contra as bases
+        self.max_tool_concurrency = int(os.getenv("MAX_TOOL_CONCURRENCY", "8"))
+        self._tool_sem = asyncio.Semaphore(self.max_tool_concurrency)
+
+        # Resultados recentes das tools; rankings mudam mais rápido que o conteúdo do site
+        self._knowledge_cache: TTLCache[str] = TTLCache(maxsize=512, ttl=120)
+        self._rankings_cache: TTLCache[str] = TTLCache(maxsize=512, ttl=30)
+
+        # Cache de respostas por similaridade, reaproveitando o modelo de embeddings da base
+        self.response_cache = SemanticCache(self.neogames_knowledge.embeddings.embed_query)
 
         self.tools = self._create_tools()
         if not self.tools:  # Verificação de segurança
@@ -149,118 +455,137 @@ class AgentManager:
 
     def _create_tools(self) -> List[BaseTool]:
         try:
+            # As especificações são fixas (módulo); aqui só ligamos os callables da instância
             knowledge_tools = [
                 Tool(
-                    name="news_systems",
-                    func=lambda x: self.neogames_knowledge.query(x, sources=[KnowledgeSource.NEWS, KnowledgeSource.SYSTEM], k=5),
-                    description="Usa para ver notícias recentes e informações sobre sistemas/mecânicas do jogo"
-                ),
-                Tool(
-                    name="vip_shop_info",
-                    func=lambda x: self.neogames_knowledge.query(x, sources=[KnowledgeSource.VIP, KnowledgeSource.SHOP, KnowledgeSource.RECHARGE], k=5),
-                    description="Usa para informações sobre VIP, Loja de Cash, Recarga/Docao/Donate/Recarregar"
-                    
-                ),
-                Tool(
-                    name="faq_help",
-                    func=lambda x: self.neogames_knowledge.query(x, sources=[KnowledgeSource.FAQ, KnowledgeSource.DOWNLOAD], k=5),
-                    description="Usa para ver perguntas frequentes e ajuda com download/instalação"
-                )
-            ]
-            
-            # Ferramentas para rankings (mantidas sem alteração)
-            ranking_tools = [
-                Tool(
-                    name="guild_ranking",
-                    func=partial(self.neogames_rankings.query, ranking_types=[RANKING_TYPE_GUILD]),
-                    description="Usa pra ver o ranking das guilds."
-                ),
-                Tool(
-                    name="memorial_ranking",
-                    func=partial(self.neogames_rankings.query, ranking_types=[RANKING_TYPE_MEMORIAL]),
-                    description="Usa pra ver o ranking do memorial e sempre retorne todos os players que estão com a posse."
-                ),
-                Tool(
-                    name="war_roles",
-                    func=partial(
-                        self.neogames_rankings.query,
-                        ranking_types=[RANKING_TYPE_WAR],
-                        query_type='roles'
-                    ),
-                    description="Usa pra ver os Portadores e Guardiões atuais de cada nação."
-                ),
-                Tool(
-                    name="war_weekly",
-                    func=partial(
-                        self.neogames_rankings.query,
-                        ranking_types=[RANKING_TYPE_WAR],
-                        query_type='weekly'
+                    name=name,
+                    func=partial(self.neogames_knowledge.query, sources=list(sources), k=5),
+                    coroutine=partial(
+                        self._run_tool,
+                        name,
+                        self._knowledge_cache,
+                        partial(self.neogames_knowledge.aquery, sources=list(sources), k=5)
                     ),
-                    description="Usa pra ver o ranking semanal de guerra com pontuações e abates."
-                )
-            ]
-
-            # Ferramenta para ranking de poder geral
-            power_ranking_tool = [
-                Tool(
-                    name="power_ranking",
-                    func=partial(self.neogames_rankings.query, ranking_types=[RANKING_TYPE_POWER]),
-                    description="Usa pra ver o ranking geral de poder dos players (sem filtro de classe)."
+                    description=description
                 )
+                for name, sources, description in _KNOWLEDGE_TOOL_SPECS
             ]
 
-
-            # Ferramentas para rankings de poder por classe
-            class_ranking_tools = [
+            ranking_tools = [
                 Tool(
-                    name=f"power_ranking_{class_info['short'].lower()}",
-                    func=partial(
-                        self.neogames_rankings.query,
-                        ranking_types=[RANKING_TYPE_POWER],
-                        class_abbr=class_info['short'].lower()
+                    name=name,
+                    func=partial(self.neogames_rankings.query, **query_kwargs),
+                    coroutine=partial(
+                        self._run_tool,
+                        name,
+                        self._rankings_cache,
+                        partial(self.neogames_rankings.aquery, **query_kwargs)
                     ),
-                    description=f"Usa pra ver o ranking de poder dos {class_info['name_pt']} ({class_info['short']})."
+                    description=description
                 )
-                for class_id, class_info in CLASS_MAPPING.items()
+                for name, query_kwargs, description in _RANKING_TOOL_SPECS
             ]
+            ranking_tools.append(
+                StructuredTool.from_function(
+                    func=self._power_ranking_class,
+                    coroutine=self._apower_ranking_class,
+                    name=_POWER_CLASS_TOOL_NAME,
+                    description=_POWER_CLASS_TOOL_DESCRIPTION,
+                    args_schema=PowerRankingClassInput
+                )
+            )
             if not knowledge_tools:
                 logger.error("Falha ao criar knowledge tools")
                 return None
 
-            return knowledge_tools + ranking_tools + power_ranking_tool + class_ranking_tools
+            self._tools_by_name = {tool.name: tool for tool in knowledge_tools + ranking_tools}
+            return knowledge_tools + ranking_tools
         except Exception as e:
             
             logger.error(f"Erro ao criar tools: {e}")
             return None
 
-    def _create_prompt(self) -> PromptTemplate:
-        template = SYSTEM_PROMPT + "\n\n" + """
-        Histórico da Conversa:
-        {history}
-        
-        Solicitação Atual: {input}
-        
-        Contexto Adicional:
-        - Data/Hora: {current_datetime}
-        - Histórico de Ações: {agent_scratchpad}
+    def _power_ranking_class(self, question: str, class_abbr: PowerRankingClass) -> str:
+        return self.neogames_rankings.query(
+            question, ranking_types=[RANKING_TYPE_POWER], class_abbr=PowerRankingClass(class_abbr).value
+        )
+
+    async def _apower_ranking_class(self, question: str, class_abbr: PowerRankingClass) -> str:
+        abbr = PowerRankingClass(class_abbr).value
+        # Chave de cache/single-flight por classe, como as antigas tools separadas
+        return await self._run_tool(
+            f"power_ranking_{abbr}",
+            self._rankings_cache,
+            partial(self.neogames_rankings.aquery, ranking_types=[RANKING_TYPE_POWER], class_abbr=abbr),
+            question
+        )
+
+    async def _run_tool(
+        self,
+        tool_name: str,
+        cache: TTLCache[str],
+        query_fn: Callable[[str], Awaitable[str]],
+        question: str
+    ) -> str:
+        """
+        Executa a consulta de uma tool. Resultados recentes vêm do cache, e chamadas
+        idênticas (mesma tool e mesma pergunta) que chegam enquanto a primeira ainda
+        roda aguardam o mesmo resultado.
         """
-        return PromptTemplate.from_template(template)
+        key = (tool_name, question.strip().lower())
+
+        # Evita que o modelo fique repetindo a mesma consulta dentro de uma execução
+        run_calls = _run_tool_calls.get()
+        if run_calls is not None:
+            run_calls[key] = run_calls.get(key, 0) + 1
+            if run_calls[key] > self.max_tool_repeats:
+                logger.debug(f"Consulta repetida bloqueada: {tool_name}")
+                return _ToolNotice("Essa consulta já foi feita. Use o resultado anterior para responder.")
+
+        cached = cache.get(key)
+        if cached is not None:
+            logger.debug(f"Resultado da tool {tool_name} vindo do cache")
+            return cached
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._bounded(query_fn, question))
+            self._inflight[key] = future
+
+            def _release(done: asyncio.Future, key=key) -> None:
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+                if done.cancelled() or done.exception() is not None:
+                    return
+                if _is_cacheable_tool_result(done.result()):
+                    cache.set(key, done.result())
+
+            future.add_done_callback(_release)
+        else:
+            logger.debug(f"Reaproveitando consulta em andamento: {tool_name}")
+
+        # shield: o cancelamento (ou timeout) de um chamador não cancela a consulta
+        # dos demais, e a entrada em _inflight é liberada quando ela termina
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.tool_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout na tool {tool_name} após {self.tool_timeout}s")
+            return _ToolNotice(f"A consulta em {tool_name} demorou demais e não retornou a tempo.")
+
+    async def _bounded(self, query_fn: Callable[[str], Awaitable[str]], question: str) -> str:
+        """Executa a consulta respeitando o limite de concorrência das tools."""
+        async with self._tool_sem:
+            return await query_fn(question)
+
+    def _create_prompt(self) -> ChatPromptTemplate:
+        return _PROMPT
 
     def _create_agent(self):
-        llm = llm_manager.get_llm("openai")
-        
-        # Modificar o prompt para enfatizar o uso da pergunta completa
-        tool_prompt = """Para encontrar as informações mais precisas:
-        1. Selecione a ferramenta mais apropriada
-        2. Use a pergunta COMPLETA do usuário
-        3. NÃO resuma ou modifique a pergunta
-        4. NÃO extraia apenas palavras-chave"""
-        
-        # Adicionar essa instrução ao prompt existente
-        self.prompt.template = tool_prompt + "\n\n" + self.prompt.template
-        
-        return create_openai_functions_agent(
-            llm,
+        # Agente de tool calling (bind_tools do próprio modelo): com tools na requisição a
+        # OpenAI já permite várias tool_calls numa mesma resposta, e o AgentExecutor
+        # (caminho async) executa todas via asyncio.gather
+        return create_tool_calling_agent(
+            _OPENAI_LLM,
             self.tools,
             self.prompt
         )
@@ -269,76 +594,236 @@ class AgentManager:
         return AgentExecutor(
             agent=self.agent,
             tools=self.tools,
-            verbose=True,
+            verbose=_AGENT_VERBOSE,
             max_iterations=self.max_iterations,
+            max_execution_time=self.max_execution_time,
+            # "generate" não é suportado por agentes multi-action (tool calling)
             early_stopping_method="force",
-            handle_parsing_errors=True
+            handle_parsing_errors=_handle_parsing_error
         )
 
-    async def process_message(self, user_id: str, message: str, context: dict) -> str:
-        """Processa uma mensagem do usuário e retorna uma resposta."""
-        logger.debug(f"Processando mensagem do usuário {user_id}: {message[:100]}...")
+    def _build_inputs(self, user_id: str, message: str, context: dict) -> dict:
+        """Monta as entradas do executor a partir do contexto e do histórico."""
+        # Até 3 mensagens anteriores, já unidas pelo conversation_manager
+        recent_history = conversation_manager.get_recent_text(user_id)
 
-        # Gerencia contexto
-        if 'tool_calls' not in context:
-            context['tool_calls'] = {}
-        
-        # Limpa chamadas antigas
-        current_time = asyncio.get_event_loop().time()
-        context['tool_calls'] = {
-            k: v for k, v in context['tool_calls'].items()
-            if current_time - v['timestamp'] < 300
+        # Prepara inputs com contexto enriquecido (horário de Brasília)
+        return {
+            "current_datetime": _current_datetime_text(),
+            "history": recent_history or "Primeira interação",
+            "input": message
         }
 
-        # Obtém histórico e enriquece o contexto
-        history = conversation_manager.get_history(user_id)
-        if history:
-            # Pega até 3 mensagens anteriores para contexto
-            recent_history = history[-3:]
+    async def _answer_routed_intent(self, message: str) -> str:
+        """
+        Responde pedidos diretos de ranking chamando a tool; '' se não houver rota,
+        se a tool não trouxe dados (erro, timeout, ranking vazio) — aí o agente responde.
+        """
+        route = _route_intent(message)
+        if route is None:
+            return ""
+        tool_name, class_abbr = route
+        logger.debug(f"Mensagem roteada direto para {tool_name} ({class_abbr or '-'})")
+        if class_abbr:
+            result = await self._apower_ranking_class(message, class_abbr)
         else:
-            recent_history = []
-
-        # Define horário atual (Brasília)
-        brazil_tz = pytz.timezone('America/Sao_Paulo')
-        current_datetime = datetime.now(brazil_tz).strftime("%d de %B de %Y às %H:%M")
-        
-        # Prepara inputs com contexto enriquecido
-        inputs = {
-            "current_datetime": current_datetime,
-            "history": "\n".join(recent_history) if recent_history else "Primeira interação",
-            "input": message,
-            "agent_scratchpad": context.get("agent_scratchpad", "")
+            result = await self._tools_by_name[tool_name].coroutine(message)
+        if not _is_direct_answer(result):
+            return ""
+        return f"{result}\n\nPrecisando de mais alguma coisa é só chamar, tmj!"
+
+    async def process_message_stream(
+        self,
+        user_id: str,
+        message: str,
+        context: dict,
+        outcome: Optional[dict] = None
+    ) -> AsyncIterator[str]:
+        """
+        Processa uma mensagem do usuário entregando a resposta em pedaços, à medida
+        que o modelo gera a resposta final (a partir do primeiro parágrafo). Ao final,
+        salva a resposta no histórico e, se outcome for passado, guarda nele a resposta
+        final em outcome['response'].
+        """
+        logger.debug(f"Processando mensagem (stream) do usuário {user_id}: {message[:100]}...")
+
+        inputs = self._build_inputs(user_id, message, context)
+
+        # As tasks das tools herdam este contexto e contam as chamadas desta execução
+        _run_tool_calls.set({})
+
+        # Pedido direto de ranking: responde com a tool, sem LLM
+        routed = await self._answer_routed_intent(message)
+        if routed:
+            yield routed
+            self._save_exchange(user_id, message, routed, outcome)
+            return
+
+        # Cache de respostas: mesma pergunta (por similaridade) com o mesmo histórico recente
+        cache_vector = None
+        cache_namespace = inputs["history"]
+        if not _VOLATILE_QUERY_RE.search(message):
+            cache_vector = await asyncio.to_thread(self.response_cache.embed, message)
+            cached = self.response_cache.get(cache_vector, cache_namespace)
+            if cached is not None:
+                logger.debug(f"Resposta do cache para o usuário {user_id}")
+                yield cached
+                self._save_exchange(user_id, message, cached, outcome)
+                return
+
+        streamed: List[str] = []
+        # Texto de cada chamada ao modelo fica retido até fechar o primeiro parágrafo sem
+        # nenhum tool_call_chunk (aí é a resposta final e passa a ir token a token);
+        # turnos que pedem tools (às vezes com texto junto) não chegam ao usuário
+        pending: Dict[str, List[str]] = {}
+        released = set()
+        tool_runs = set()
+        used_tools = set()
+        output = ""
+
+        # Executor único e sem estado por usuário; a identificação da execução vai na config
+        run_config = {
+            "run_name": "neo_agent",
+            "tags": ["whatsapp"],
+            "metadata": {"user_id": user_id},
         }
-        
+
+        async for event in self.executor.astream_events(inputs, config=run_config, version="v2"):
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                run_id = event["run_id"]
+                chunk = event["data"]["chunk"]
+                if getattr(chunk, "tool_call_chunks", None):
+                    tool_runs.add(run_id)
+                    if run_id in released:
+                        logger.warning(f"Modelo pediu tools depois de já ter respondido ao usuário {user_id}")
+                    pending.pop(run_id, None)
+                    continue
+                content = chunk.content
+                if not content or not isinstance(content, str) or run_id in tool_runs:
+                    continue
+                if run_id in released:
+                    streamed.append(content)
+                    yield content
+                    continue
+                buffer = pending.setdefault(run_id, [])
+                buffer.append(content)
+                text = "".join(buffer)
+                if "\n\n" in text:
+                    released.add(run_id)
+                    del pending[run_id]
+                    streamed.append(text)
+                    yield text
+            elif kind == "on_chat_model_end":
+                run_id = event["run_id"]
+                text = "".join(pending.pop(run_id, []))
+                is_tool_turn = run_id in tool_runs or getattr(event["data"].get("output"), "tool_calls", None)
+                if text and not is_tool_turn:
+                    streamed.append(text)
+                    yield text
+            elif kind == "on_tool_start":
+                used_tools.add(event["name"])
+            elif kind == "on_chain_end" and not event["parent_ids"]:
+                # Fim do AgentExecutor: saída final (inclui paradas forçadas)
+                output = (event["data"].get("output") or {}).get("output", "")
+
+        if output == _AGENT_STOPPED_OUTPUT:
+            # Parada forçada: não repassa a mensagem interna do LangChain ao usuário
+            logger.warning(f"Agente parou por limite de iterações/tempo para o usuário {user_id}")
+            output = ""
+        response = output or "".join(streamed)
+        if not response or response.strip() == "":
+            response = "Desculpe, não consegui processar sua pergunta. Pode tentar perguntar de outro jeito?"
+        if not streamed:
+            # Nada foi gerado pelo modelo (ex.: parada forçada); entrega a resposta inteira
+            yield response
+
+        if cache_vector is not None and output and not used_tools & _VOLATILE_TOOLS:
+            self.response_cache.put(cache_vector, response, cache_namespace)
+
+        # Salva no histórico
+        self._save_exchange(user_id, message, response, outcome)
+
+    @staticmethod
+    def _save_exchange(user_id: str, message: str, response: str, outcome: Optional[dict]) -> None:
+        """Salva pergunta e resposta no histórico e registra a resposta final em outcome."""
+        conversation_manager.add_message(user_id, message, role='user')
+        conversation_manager.add_message(user_id, response, role='assistant')
+        if outcome is not None:
+            outcome['response'] = response
+
+    async def stream_response(
+        self,
+        user_id: str,
+        message: str,
+        context: dict,
+        outcome: Optional[dict] = None
+    ) -> AsyncIterator[str]:
+        """
+        Entrega a resposta em pedaços com o limite de tempo da requisição.
+        Em caso de timeout ou erro antes de qualquer entrega, envia só a mensagem de
+        fallback; o histórico guarda sempre o que o usuário de fato recebeu.
+        """
+        outcome = {} if outcome is None else outcome
+        delivered: List[str] = []
+        fallback = None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.request_timeout
+        stream = self.process_message_stream(user_id, message, context, outcome)
         try:
-            # Executa com timeout
-            response_dict = await asyncio.wait_for(
-                self.executor.ainvoke(inputs),
-                timeout=30
-            )
-            
-            response = response_dict.get("output", "")
-            if not response or response.strip() == "":
-                response = "Desculpe, não consegui processar sua pergunta. Pode tentar perguntar de outro jeito?"
-            
-            # Salva no histórico
-            conversation_manager.add_message(user_id, message, role='user')
-            conversation_manager.add_message(user_id, response, role='assistant')
-            
-            return response
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(
+                        stream.__anext__(),
+                        timeout=max(deadline - loop.time(), 0)
+                    )
+                except StopAsyncIteration:
+                    return
+                delivered.append(chunk)
+                yield chunk
             
         except asyncio.TimeoutError:
             logger.error(f"Timeout ao processar mensagem do usuário {user_id}")
-            return "Opa, demorou muito pra processar! Tenta perguntar de outro jeito ou divide em perguntas menores, blz?"
+            fallback = "Opa, demorou muito pra processar! Tenta perguntar de outro jeito ou divide em perguntas menores, blz?"
             
         except Exception as e:
             logger.error(f"Erro ao processar mensagem do usuário {user_id}: {e}")
-            return "Opa, deu um erro aqui! Tenta de novo daqui a pouco, blz?"
+            fallback = "Opa, deu um erro aqui! Tenta de novo daqui a pouco, blz?"
+
+        finally:
+            await stream.aclose()
+            # Interrompido antes de salvar (timeout, erro ou quem consome fechou o stream,
+            # ex.: falha no envio): a resposta já entregue vale; sem nada entregue, o fallback
+            response = "".join(delivered) or fallback
+            if 'response' not in outcome and response:
+                self._save_exchange(user_id, message, response, outcome)
 
-# Instância do Agent Manager
-agent_manager = AgentManager()
-neogames_knowledge = agent_manager.neogames_knowledge
-neogames_rankings = agent_manager.neogames_rankings
-agent_executor = agent_manager.executor
+        if fallback and not delivered:
+            yield fallback
 
-__all__ = ['agent_manager', 'neogames_knowledge', 'neogames_rankings', 'agent_executor']
\ No newline at end of file
+    async def process_message(self, user_id: str, message: str, context: dict) -> str:
+        """Processa uma mensagem do usuário e retorna a resposta final (a mesma salva no histórico)."""
+        outcome: dict = {}
+        async for _ in self.stream_response(user_id, message, context, outcome):
+            pass
+        return outcome['response']
+
+@lru_cache(maxsize=1)
+def get_agent_manager() -> AgentManager:
+    """Instância única do Agent Manager, criada no primeiro uso (carrega modelos e bases)."""
+    return AgentManager()
+
+# Nomes exportados resolvidos sob demanda: importar o módulo não instancia o agente
+_LAZY_EXPORTS = {
+    'agent_manager': lambda manager: manager,
+    'neogames_knowledge': lambda manager: manager.neogames_knowledge,
+    'neogames_rankings': lambda manager: manager.neogames_rankings,
+    'agent_executor': lambda manager: manager.executor,
+}
+
+def __getattr__(name: str):
+    if name in _LAZY_EXPORTS:
+        return _LAZY_EXPORTS[name](get_agent_manager())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+__all__ = ['get_agent_manager', 'agent_manager', 'neogames_knowledge', 'neogames_rankings', 'agent_executor']
\ No newline at end of file
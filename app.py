@@ -1,23 +1,25 @@
 #app.py
 import logging
 import re
-import json
+import orjson
 import os
 import time
 import ssl
 import asyncio
-import pytz
 from datetime import datetime
+from zoneinfo import ZoneInfo
 from typing import Dict, List, Optional, Any
-from quart import Quart, request, jsonify
+from quart import Quart, Response, request
+from hypercorn.asyncio import serve
 from hypercorn.config import Config
 
 # Importa o Agent Manager já atualizado (que contém a base de conhecimento)
-from agents.agent_setup import agent_manager
+from agents.agent_setup import get_agent_manager
 from services.audio_processing import handle_audio_message
-from utils.message_buffer import handle_message_with_buffer, update_presence
-from utils.smart_message_processor import send_message_in_chunks
+from utils.message_buffer import handle_message_with_buffer, update_presence_bulk
+from utils.smart_message_processor import send_message_in_chunks, send_stream_in_chunks
 from utils.conversation_manager import conversation_manager
+from utils.ttl_cache import TTLCache
 
 # Configuração de logging
 logging.basicConfig(
@@ -34,14 +36,50 @@ config = Config()
 config.startup_timeout = 30  # 30 segundos para startup inicial
 config.keep_alive_timeout = 300
 
+# Fuso horário carregado uma única vez (zoneinfo da stdlib, sem pytz)
+_BRAZIL_TZ = ZoneInfo("America/Sao_Paulo")
+_BRAZIL_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
 # Variáveis globais
-processed_message_ids = set()
+# IDs já processados: cada um expira sozinho após 10 min, com teto de memória
+processed_message_ids: TTLCache[bool] = TTLCache(maxsize=50_000, ttl=600)
 initialization_task = None
 
+# JID do próprio agente, calculado uma vez para filtrar as mensagens que ele envia
+AGENT_JID = f"{conversation_manager.normalize_phone('5511911043825')}@s.whatsapp.net"
+
+class RequestLogAdapter(logging.LoggerAdapter):
+    """
+    Logger com o id da mensagem e o número do remetente vinculados.
+    O prefixo só é montado quando o registro for de fato emitido.
+    """
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['message_id']} {self.extra['number']}] {msg}", kwargs
+
+def fast_json(payload: Dict[str, Any], status: int = 200) -> Response:
+    """Resposta JSON serializada com orjson."""
+    return Response(orjson.dumps(payload), status=status, mimetype="application/json")
+
 def get_brazil_time() -> str:
     """Retorna a data e hora atual no fuso horário de Brasília."""
-    brazil_tz = pytz.timezone('America/Sao_Paulo')
-    return datetime.now(brazil_tz).strftime("%Y-%m-%d %H:%M:%S")
+    return datetime.now(_BRAZIL_TZ).strftime(_BRAZIL_TIME_FORMAT)
+
+def extract_sender_number(message_data: Dict[str, Any], key: Dict[str, Any]) -> str:
+    """
+    Extrai o número do remetente do JID da mensagem e o normaliza.
+    Retorna string vazia se a mensagem não tiver JID.
+    """
+    remote_jid = (
+        key.get("remoteJid", "")
+        or message_data.get("remoteJid", "")
+        or message_data.get("jid", "")
+    )
+    # partition não cria listas intermediárias como o split
+    raw_number = remote_jid.partition("@")[0].partition(":")[0]
+    if not raw_number:
+        return ""
+    return conversation_manager.normalize_phone(raw_number)
 
 @app.before_serving
 async def startup():
@@ -54,6 +92,8 @@ async def startup():
     async def initialize_background():
         try:
             logger.info("Iniciando inicialização em background...")
+            # Constrói o agente aqui, e não no import do app
+            agent_manager = get_agent_manager()
             # Inicializa a base de conhecimento primeiro
             await agent_manager.neogames_knowledge.initialize()
             logger.info("Base de conhecimento inicializada")
@@ -63,19 +103,6 @@ async def startup():
             # Depois inicializa os rankings
             await agent_manager.neogames_rankings.initialize()
             logger.info("Base de rankings inicializada")
-            
-            # Configura a limpeza periódica do cache
-            async def clear_message_cache():
-                while True:
-                    try:
-                        await asyncio.sleep(3600)  # Limpa a cada hora
-                        processed_message_ids.clear()
-                        logger.info("Cache de mensagens processadas limpo")
-                    except Exception as e:
-                        logger.error(f"Erro ao limpar cache: {e}")
-                        await asyncio.sleep(60)
-            
-            app.add_background_task(clear_message_cache)
             logger.info("Inicialização em background concluída!")
             
         except Exception as e:
@@ -99,9 +126,11 @@ async def shutdown():
             except asyncio.CancelledError:
                 pass
         
-        # Desliga os serviços
-        if hasattr(agent_manager.neogames_knowledge, 'shutdown'):
-            await agent_manager.neogames_knowledge.shutdown()
+        # Desliga os serviços (só se o agente chegou a ser criado)
+        if get_agent_manager.cache_info().currsize:
+            agent_manager = get_agent_manager()
+            if hasattr(agent_manager.neogames_knowledge, 'shutdown'):
+                await agent_manager.neogames_knowledge.shutdown()
         logger.info("Serviços desligados com sucesso!")
     except Exception as e:
         logger.error(f"Erro no desligamento: {str(e)}")
@@ -125,16 +154,17 @@ async def process_user_message(message: str, number: str):
             'current_user': number,
         }
         
-        # Processa a mensagem usando o agent_manager
-        response = await agent_manager.process_message(
-            user_id=number,
-            message=message,
-            context=user_context
+        # Processa a mensagem usando o agent_manager e envia cada parágrafo
+        # assim que o modelo termina de gerá-lo
+        await send_stream_in_chunks(
+            get_agent_manager().stream_response(
+                user_id=number,
+                message=message,
+                context=user_context
+            ),
+            number
         )
         
-        # Envia a resposta usando o processador de mensagens
-        await send_message_in_chunks(response, number)
-        
     except Exception as e:
         logger.error(f"Erro ao processar mensagem: {e}", exc_info=True)
         raise
@@ -145,16 +175,22 @@ async def webhook():
     try:
         # Verifica se o sistema ainda está inicializando
         if initialization_task and not initialization_task.done():
-            return jsonify({
+            return fast_json({
                 "status": "initializing",
                 "message": "O sistema ainda está inicializando. Por favor, aguarde alguns minutos."
-            }), 503
+            }, 503)
 
-        data = await request.get_json()
-        logger.debug(f"Webhook recebido: {data}")
+        raw_body = await request.get_data()
+        try:
+            data = orjson.loads(raw_body) if raw_body else None
+        except orjson.JSONDecodeError:
+            logger.warning("Webhook com JSON inválido, ignorando...")
+            data = None
+        # %-style: o payload só é convertido em texto se o DEBUG estiver ativo
+        logger.debug("Webhook recebido: %s", data)
 
         if not data:
-            return jsonify({"status": "ignored"}), 200
+            return fast_json({"status": "ignored"})
 
         event_type = data.get("event")
         message_data = data.get("data", {})
@@ -162,91 +198,105 @@ async def webhook():
         # Processa eventos de presença
         if event_type == "presence.update":
             try:
-                presence_data = message_data.get("presences", {})
-                for number, status in presence_data.items():
-                    number = number.split("@")[0]
-                    logger.debug(f"Atualizando presença para {number}: {status}")
-                    update_presence(number, status)
-                return jsonify({"status": "success"}), 200
+                # Todas as presenças do evento numa única chamada
+                update_presence_bulk(message_data.get("presences", {}))
+                return fast_json({"status": "success"})
             except Exception as e:
                 logger.error(f"Erro ao processar presence.update: {e}")
-                return jsonify({"status": "error", "message": str(e)}), 500
+                return fast_json({"status": "error", "message": str(e)}, 500)
 
         if isinstance(message_data, list) and message_data:
             message_data = message_data[0]
+        # Métodos usados várias vezes abaixo, resolvidos uma única vez
+        data_get = message_data.get
 
         # Verifica se a mensagem foi enviada pelo próprio agente
-        agent_number = conversation_manager.normalize_phone('5511911043825')
-        if message_data.get('sender') == f"{agent_number}@s.whatsapp.net":
+        if data_get('sender') == AGENT_JID:
             logger.info("Mensagem enviada pelo agente, ignorando...")
-            return jsonify({"status": "success"}), 200
+            return fast_json({"status": "success"})
 
         # Verifica processamento duplicado
-        message_id = message_data.get("key", {}).get("id")
+        key = data_get("key") or {}
+        message_id = key.get("id")
+        log = RequestLogAdapter(logger, {"message_id": message_id, "number": "-"})
         if message_id and message_id in processed_message_ids:
-            logger.info(f"Mensagem {message_id} já processada.")
-            return jsonify({"status": "ignored"}), 200
-
-        # Extrai e normaliza o número do remetente
-        remote_jid = (
-            message_data.get("key", {}).get("remoteJid", "")
-            or message_data.get("remoteJid", "")
-            or message_data.get("jid", "")
+            log.info("Mensagem já processada.")
+            return fast_json({"status": "ignored"})
+
+        # Só mensagens novas seguem adiante; o resto é descartado antes de
+        # extrair e normalizar o número do remetente
+        if event_type != "messages.upsert":
+            return fast_json({"status": "ignored"})
+
+        number = extract_sender_number(message_data, key)
+        if not number:
+            return fast_json({"status": "ignored"})
+        log.extra["number"] = number
+
+        msg_content = data_get("message") or {}
+        content_get = msg_content.get
+
+        # Processa mensagem de áudio
+        if "audioMessage" in msg_content:
+            base64_data = content_get("base64") or data_get("base64")
+            if base64_data:
+                await handle_audio_message({"base64": base64_data}, number)
+                if message_id:
+                    processed_message_ids.set(message_id, True)
+                return fast_json({"status": "processed"})
+            return fast_json({"status": "error", "message": "Base64 não encontrado"})
+
+        # Processa mensagem de texto
+        message_text = (
+            content_get("conversation")
+            or (content_get("extendedTextMessage") or {}).get("text")
         )
-        raw_number = remote_jid.split("@")[0].split(":")[0] if remote_jid else ""
-        if not raw_number:
-            return jsonify({"status": "ignored"}), 200
-            
-        number = conversation_manager.normalize_phone(raw_number)
-
-        if event_type == "messages.upsert":
-            msg_content = message_data.get("message", {})
-
-            # Processa mensagem de áudio
-            if "audioMessage" in msg_content:
-                base64_data = msg_content.get("base64") or message_data.get("base64")
-                if base64_data:
-                    await handle_audio_message({"base64": base64_data}, number)
-                    processed_message_ids.add(message_id)
-                    return jsonify({"status": "processed"}), 200
-                return jsonify({"status": "error", "message": "Base64 não encontrado"}), 200
-
-            # Processa mensagem de texto
-            message_text = (
-                msg_content.get("conversation")
-                or msg_content.get("extendedTextMessage", {}).get("text")
-            )
-            if message_text:
-                task = asyncio.create_task(process_user_message(message_text, number))
-                try:
-                    await asyncio.wait_for(task, timeout=60.0)
-                    processed_message_ids.add(message_id)
-                    return jsonify({"status": "processed"}), 200
-                except asyncio.TimeoutError:
-                    logger.error("Timeout ao processar mensagem")
-                    return jsonify({"status": "error", "message": "Timeout"}), 500
-
-        return jsonify({"status": "ignored"}), 200
+        if message_text:
+            try:
+                await asyncio.wait_for(process_user_message(message_text, number), timeout=60.0)
+                if message_id:
+                    processed_message_ids.set(message_id, True)
+                return fast_json({"status": "processed"})
+            except asyncio.TimeoutError:
+                log.error("Timeout ao processar mensagem")
+                return fast_json({"status": "error", "message": "Timeout"}, 500)
+
+        return fast_json({"status": "ignored"})
 
     except Exception as e:
         logger.error(f"Erro no webhook: {str(e)}", exc_info=True)
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return fast_json({"status": "error", "message": str(e)}, 500)
 
 @app.route('/health', methods=['GET'])
 async def health_check():
     """Endpoint para verificar o status do servidor."""
-    return jsonify({
+    return fast_json({
         "status": "initializing" if (initialization_task and not initialization_task.done()) else "ready",
         "timestamp": datetime.utcnow().isoformat()
     })
 
+def install_fast_event_loop() -> None:
+    """
+    Usa o uvloop (ou winloop no Windows) como event loop, se estiver instalado.
+    Sem ele, segue com o loop padrão do asyncio.
+    """
+    try:
+        import uvloop as fast_loop
+    except ImportError:
+        try:
+            import winloop as fast_loop
+        except ImportError:
+            logger.info("uvloop/winloop não instalado, usando o event loop padrão")
+            return
+    asyncio.set_event_loop_policy(fast_loop.EventLoopPolicy())
+    logger.info(f"Event loop: {fast_loop.__name__}")
+
 if __name__ == "__main__":
     try:
-        app.run(
-            host="0.0.0.0",
-            port=5000,
-            debug=False,
-            use_reloader=False
-        )
+        install_fast_event_loop()
+        # Serve direto pelo Hypercorn com o config acima, sem o runner de
+        # desenvolvimento do app.run (que ignorava startup/keep-alive)
+        config.bind = ["0.0.0.0:5000"]
+        asyncio.run(serve(app, config))
     except Exception as e:
         logger.error(f"Erro ao iniciar o servidor: {e}", exc_info=True)
\ No newline at end of file
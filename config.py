@@ -1,6 +1,7 @@
 #config.py
 import os
 import logging
+from functools import lru_cache
 from typing import Dict, List, Any
 from dataclasses import dataclass
 from enum import Enum
@@ -15,7 +16,7 @@ class ModelProvider(Enum):
     GROQ = "groq"
     CLAUDE = "claude"  # Adicionado Claude
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ModelConfig:
     """Configuração dos modelos de IA."""
     name: str
@@ -23,7 +24,7 @@ class ModelConfig:
     temperature: float = 0.3
     max_tokens: int = 400
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class APIConfig:
     """Configuração das APIs."""
     openai_key: str
@@ -32,7 +33,7 @@ class APIConfig:
     groq_key: str
     anthropic_key: str  # Adicionado chave do Anthropic
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class WhatsAppConfig:
     """Configuração do WhatsApp."""
     instance_name: str = "nerai"
@@ -40,7 +41,7 @@ class WhatsAppConfig:
     retry_delay: int = 1
     timeout: int = 30
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SupabaseConfig:
     """Configuração do Supabase."""
     url: str
@@ -49,16 +50,16 @@ class SupabaseConfig:
 class ConfigurationManager:
     """Gerenciador de configurações da aplicação."""
 
-    # Variáveis de ambiente requeridas
-    REQUIRED_ENV = {
-        "OPENAI_API_KEY": "Chave da API OpenAI",
-        "EVOLUTION_API_KEY": "Chave da API Evolution",
-        "EVOLUTION_API_URL": "URL da API Evolution",
-        "GROQ_API_KEY": "Chave da API Groq",
-        "ANTHROPIC_API_KEY": "Chave da API Claude",
-        "SUPABASE_URL": "URL do Supabase",
-        "SUPABASE_KEY": "Chave da API do Supabase",
-    }
+    # Variáveis de ambiente requeridas: (nome, descrição)
+    REQUIRED_ENV = (
+        ("OPENAI_API_KEY", "Chave da API OpenAI"),
+        ("EVOLUTION_API_KEY", "Chave da API Evolution"),
+        ("EVOLUTION_API_URL", "URL da API Evolution"),
+        ("GROQ_API_KEY", "Chave da API Groq"),
+        ("ANTHROPIC_API_KEY", "Chave da API Claude"),
+        ("SUPABASE_URL", "URL do Supabase"),
+        ("SUPABASE_KEY", "Chave da API do Supabase"),
+    )
 
     # Configurações dos modelos
     MODELS = {
@@ -93,11 +94,17 @@ class ConfigurationManager:
             EnvironmentError: Se variáveis requeridas estiverem faltando
         """
         load_dotenv(override=True)
+
+        # O .env só é carregado aqui, então os valores podem ser lidos uma única vez
+        self._env_snapshot: Dict[str, Any] = {
+            key: os.getenv(key)
+            for key, _ in self.REQUIRED_ENV
+        }
         
         missing = [
             f"{key} ({desc})"
-            for key, desc in self.REQUIRED_ENV.items()
-            if not os.getenv(key)
+            for key, desc in self.REQUIRED_ENV
+            if not self._env_snapshot[key]
         ]
         
         if missing:
@@ -150,10 +157,7 @@ class ConfigurationManager:
     @property
     def environment(self) -> Dict[str, Any]:
         """Retorna todas as variáveis de ambiente carregadas."""
-        return {
-            key: os.getenv(key)
-            for key in self.REQUIRED_ENV
-        }
+        return self._env_snapshot
   
     def get_model_config(self, provider: ModelProvider) -> ModelConfig:
         """
@@ -183,4 +187,14 @@ API_CONFIG = config_manager.api_config
 
 # Exporta configurações do Supabase
 SUPABASE_CONFIG = config_manager.supabase_config
-SUPABASE_CLIENT = create_client(SUPABASE_CONFIG.url, SUPABASE_CONFIG.key)
\ No newline at end of file
+
+@lru_cache(maxsize=1)
+def get_supabase_client() -> Client:
+    """Cliente único do Supabase, criado no primeiro uso e não na importação."""
+    return create_client(SUPABASE_CONFIG.url, SUPABASE_CONFIG.key)
+
+# SUPABASE_CLIENT continua disponível, resolvido sob demanda
+def __getattr__(name: str):
+    if name == "SUPABASE_CLIENT":
+        return get_supabase_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,31 @@
+#knowledge_base/html_text.py
+"""
+Extração de texto das páginas do site.
+Separado de neogames_knowledge para que a função rode nos workers do pool de
+parsing sem depender da instância da base (só bs4/lxml).
+"""
+import soupsieve as sv
+from bs4 import BeautifulSoup
+
+# Candidatos a conteúdo principal, em ordem de preferência (compilados uma única vez)
+_MAIN_SELECTORS = (
+    sv.compile('main'),
+    sv.compile('div[role="main"]'),
+    sv.compile('div.content, div.main-content'),
+)
+# Ruído removido numa única passada; é a única limpeza, inclusive das páginas do Playwright
+_NOISE_SELECTOR = sv.compile('script, style, noscript, nav, header, footer, .modal')
+
+def extract_main_text(html: str) -> str:
+    """Extrai o texto do conteúdo principal, sem elementos de navegação/scripts."""
+    soup = BeautifulSoup(html, 'lxml')
+    main_content = next(
+        (found for found in (selector.select_one(soup) for selector in _MAIN_SELECTORS) if found),
+        soup
+    )
+
+    # Só o conteúdo principal é limpo: o resto da página é descartado de qualquer forma
+    for tag in _NOISE_SELECTOR.select(main_content):
+        tag.decompose()
+
+    return main_content.get_text(separator=' ', strip=True)
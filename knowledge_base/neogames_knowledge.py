@@ -1,27 +1,97 @@
 #knowledge_base/neogames_knowledge.py
+import io
 import os
+import multiprocessing
+import shutil
 import logging
 import asyncio
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, UTC
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
-import xml.etree.ElementTree as ET
+from functools import lru_cache
 from urllib.parse import urlparse, urljoin
 import torch
+import numpy as np
+import faiss
 
-import requests
+import httpx
+import orjson
+from lxml import etree
 from rank_bm25 import BM25Okapi
-from bs4 import BeautifulSoup
 from langchain_community.document_loaders import PlaywrightURLLoader
+from langchain_community.document_loaders.url_playwright import PlaywrightEvaluator
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings
 
+from utils.ttl_cache import TTLCache
+from knowledge_base.html_text import extract_main_text
+
 
 logger = logging.getLogger(__name__)
 
+# Modelo multilíngue usado para documentos e perguntas
+EMBEDDING_MODEL = "intfloat/multilingual-e5-large"
+
+@lru_cache(maxsize=None)
+def get_embeddings(model_name: str = EMBEDDING_MODEL) -> HuggingFaceEmbeddings:
+    """
+    Modelo de embeddings compartilhado no processo: carregado uma única vez
+    por nome, mesmo com várias instâncias da base de conhecimento.
+    """
+    use_cuda = torch.cuda.is_available()
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={
+            'device': 'cuda' if use_cuda else 'cpu',
+            # Em GPU os pesos ficam em fp16: metade da memória e lotes bem mais rápidos
+            'model_kwargs': {'torch_dtype': torch.float16 if use_cuda else torch.float32}
+        },
+        # Lotes maiores que o padrão do sentence-transformers (32) aproveitam melhor a GPU;
+        # vetores normalizados deixam L2 e cosseno equivalentes no FAISS
+        encode_kwargs={
+            'batch_size': 64 if use_cuda else 32,
+            'normalize_embeddings': True,
+            'convert_to_numpy': True
+        }
+    )
+
+# Embeddings float32 salvos junto do índice FAISS (que guarda só a versão quantizada)
+_RAW_VECTORS_FILE = "vectors.npy"
+
+QUERY_ERROR_MESSAGE = "Erro ao consultar a base de conhecimento."
+NOT_INITIALIZED_MESSAGE = "Base de conhecimento não inicializada."
+
+def _create_html_pool() -> ProcessPoolExecutor:
+    """
+    Pool de processos para o parsing de HTML: o BeautifulSoup segura o GIL, então só
+    processos tiram esse trabalho do event loop de verdade. Filhos via spawn, e não fork:
+    fork com o processo já cheio de threads (torch, loop, logging) pode travar os filhos.
+    Os workers importam só knowledge_base.html_text (bs4/lxml), nunca torch/FAISS.
+    """
+    return ProcessPoolExecutor(
+        max_workers=min(4, os.cpu_count() or 1),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+class _RawHtmlEvaluator(PlaywrightEvaluator):
+    """
+    Devolve o HTML renderizado da página, sem a extração de texto do unstructured
+    (evaluator padrão do PlaywrightURLLoader): a limpeza de nav/footer/modais e a
+    escolha do conteúdo principal ficam com extract_main_text, numa única passada.
+    """
+
+    def evaluate(self, page, browser, response) -> str:
+        return page.content()
+
+    async def evaluate_async(self, page, browser, response) -> str:
+        return await page.content()
+
 class KnowledgeSource(Enum):
     """Enumeração das diferentes seções do site (exceto rankings, que já são tratados separadamente)"""
     MAIN = "main"
@@ -40,6 +110,33 @@ class SitemapEntry:
     lastmod: Optional[datetime] = None
     priority: float = 0.5
 
+SITE_URL = "https://www.neogames.online"
+
+# Tags do sitemap já com namespace, para o iterparse/findtext do lxml
+_SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+_SITEMAP_URL_TAG = f"{_SITEMAP_NS}url"
+_SITEMAP_LOC_TAG = f"{_SITEMAP_NS}loc"
+_SITEMAP_LASTMOD_TAG = f"{_SITEMAP_NS}lastmod"
+_SITEMAP_PRIORITY_TAG = f"{_SITEMAP_NS}priority"
+
+# URLs conhecidas que podem não estar no sitemap, montadas uma única vez na importação
+DEFAULT_MANUAL_URLS: Dict[KnowledgeSource, Tuple[str, ...]] = {
+    # URLs de notícias importantes
+    KnowledgeSource.NEWS: (
+        f"{SITE_URL}/news/como-obter-asa-arcana-colecao-e-link-estelar",
+    ),
+    # Outras URLs importantes
+    KnowledgeSource.SHOP: (f"{SITE_URL}/shop",),
+    KnowledgeSource.RECHARGE: (f"{SITE_URL}/recharge",),
+    KnowledgeSource.VIP: (f"{SITE_URL}/vip",),
+}
+
+# Fonte de cada URL do sitemap pelo primeiro segmento do caminho (/news/..., /faq, ...);
+# a raiz do site é MAIN e caminhos de outras seções ficam de fora
+_SOURCE_BY_PATH_PREFIX: Dict[str, KnowledgeSource] = {
+    source.value: source for source in KnowledgeSource if source is not KnowledgeSource.MAIN
+}
+
 class NeoGamesKnowledge:
     def __init__(self, base_dir: str = "knowledge_base"):
         """
@@ -49,17 +146,23 @@ class NeoGamesKnowledge:
             base_dir: Diretório base para armazenar os dados
         """
         self.base_dir = base_dir
-        self.sitemap_url = "https://www.neogames.online/sitemap.xml"
-        self.base_url = "https://www.neogames.online"
-        self.bm25_index = None
-        self.documents_for_bm25 = []
+        self.sitemap_url = f"{SITE_URL}/sitemap.xml"
+        self.base_url = SITE_URL
+        # (índice BM25, documentos, fonte de cada documento): publicados juntos numa
+        # única atribuição, para uma busca em outra thread nunca misturar versões
+        self._bm25: Optional[Tuple[BM25Okapi, List[Document], np.ndarray]] = None
         
         # Define o diretório do vectorstore do site
         self.site_dir = os.path.join(self.base_dir, "neo_site")
         self.vectorstore_dir = os.path.join(self.site_dir, "faiss_store")
+        # lastmod do sitemap de cada URL já indexada (páginas inalteradas não são baixadas de novo)
+        self.manifest_path = os.path.join(self.site_dir, "manifest.json")
         
         # Único vectorstore para todo o site
         self.vectorstore: Optional[FAISS] = None
+        # Embeddings float32 originais, alinhados às posições do índice (que guarda só
+        # a versão 8 bits): é deles que as reconstruções reaproveitam os vetores
+        self._raw_vectors: Optional[np.ndarray] = None
         
         # Mantém dicionário para URLs manuais (para organização)
         self.manual_urls: Dict[KnowledgeSource, List[str]] = {
@@ -71,18 +174,76 @@ class NeoGamesKnowledge:
         
         # Inicializa o monitor task
         self._monitor_task = None
+        # Garante que o índice salvo seja carregado uma vez só (ver _ensure_loaded)
+        self._load_lock = asyncio.Lock()
+        # Índice salvo que falhou ao carregar: não é relido a cada consulta (a atualização refaz a base)
+        self._load_failed = False
+
+        # Páginas são baixadas por HTTP em paralelo; o Playwright fica só para
+        # as que não trazem conteúdo no HTML estático (renderizadas via JS)
+        self.fetch_concurrency = 10
+        self.fetch_timeout = httpx.Timeout(30.0, connect=5.0)
+        self.min_static_text_length = 200
+        # Fontes carregadas ao mesmo tempo (cada uma pode abrir um navegador headless)
+        self.source_concurrency = 3
+        self._source_semaphore = asyncio.Semaphore(self.source_concurrency)
+        self._html_pool: Optional[ProcessPoolExecutor] = None
+
+        # Chunks: alvo de tamanho/overlap do splitter; pós-processamento une
+        # os pequenos da mesma página e redivide os que passam do teto
+        self.chunk_size = 1000
+        self.chunk_overlap = 200
+        self.min_chunk_length = 100
+        self.max_chunk_length = 1100
+        self._text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            separators=["\n\n", "\n", ". "]
+        )
+        # Para texto sem quebras de linha/frase, que o splitter acima não consegue cortar
+        self._fallback_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+
+        # Quantos chunks vão para o modelo de embeddings por chamada
+        self.embed_batch_size = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+
+        # Acima deste número de chunks o índice vira HNSW (busca aproximada);
+        # abaixo, a busca exata no índice int8 já é rápida o suficiente.
+        # Ajustáveis por ambiente (HNSW_MIN_VECTORS=0 usa HNSW sempre)
+        self.hnsw_min_vectors = int(os.getenv("HNSW_MIN_VECTORS", "5000"))
+        self.hnsw_m = int(os.getenv("HNSW_M", "32"))
+        self.hnsw_ef_construction = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+        self.hnsw_ef_search = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+        # Candidatos buscados no FAISS por resultado pedido quando há filtro de fonte
+        self.semantic_fetch_factor = 10
+
+        # Perguntas aguardando embedding: as que chegam dentro da janela
+        # (ex.: tool calls paralelas de um mesmo turno) são embedadas juntas
+        self.embed_batch_window = 0.005  # segundos
+        self._embed_queue: List[Tuple[str, asyncio.Future]] = []
+        # Referência forte às tasks de flush: o loop só guarda referência fraca
+        self._embed_flush_tasks: set = set()
+
+        # Embeddings das perguntas mais recentes (LRU), compartilhado entre loop e threads
+        self.query_embedding_cache_size = 4096
+        self._query_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+
+        # Respostas de consultas recentes. A chave inclui a geração do índice:
+        # cada reconstrução da base invalida tudo sem precisar limpar o cache
+        self._index_generation = 0
+        self._query_results: TTLCache[str] = TTLCache(maxsize=1024, ttl=3600)
         
         # Inicializa URLs manuais conhecidas
         self._initialize_manual_urls()
         
         # Inicializa o embeddings com um modelo multilíngue
         try:
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="intfloat/multilingual-e5-large",
-                model_kwargs={
-                    'device': 'cuda' if torch.cuda.is_available() else 'cpu'
-                }
-            )
+            self.embeddings = get_embeddings()
             logger.info("HuggingFaceEmbeddings inicializado com sucesso")
         except Exception as e:
             logger.error(f"Erro ao inicializar HuggingFaceEmbeddings: {e}")
@@ -92,36 +253,18 @@ class NeoGamesKnowledge:
         """Cria a estrutura de diretórios necessária"""
         try:
             # Cria diretório para o site
+            # O diretório do vectorstore não é pré-criado: ele só existe quando há um
+            # índice salvo (ver _save_vectorstore)
             os.makedirs(self.site_dir, exist_ok=True)
-            os.makedirs(self.vectorstore_dir, exist_ok=True)
-            logger.info(f"Criados diretórios: {self.site_dir}, {self.vectorstore_dir}")
+            logger.info(f"Criado diretório: {self.site_dir}")
         except Exception as e:
             logger.error(f"Erro ao criar diretórios: {e}")
             raise
 
     def _initialize_manual_urls(self):
         """Inicializa URLs conhecidas que podem não estar no sitemap"""
-        base = self.base_url.rstrip('/')
-        
-        # URLs de notícias importantes
-        self.manual_urls[KnowledgeSource.NEWS].extend([
-            f"{base}/news/como-obter-asa-arcana-colecao-e-link-estelar",
-        ])
-        
-        # URLs do sistema
-        self.manual_urls[KnowledgeSource.SYSTEM].extend([
-        ])
-        
-        # Outras URLs importantes
-        self.manual_urls[KnowledgeSource.SHOP].extend([
-            f"{base}/shop",            
-        ])
-        self.manual_urls[KnowledgeSource.RECHARGE].extend([
-            f"{base}/recharge",            
-        ])
-        self.manual_urls[KnowledgeSource.VIP].extend([
-            f"{base}/vip",            
-        ])
+        for source, urls in DEFAULT_MANUAL_URLS.items():
+            self.manual_urls[source].extend(urls)
 
     def add_manual_url(self, source: KnowledgeSource, url: str) -> bool:
         """
@@ -178,9 +321,9 @@ class NeoGamesKnowledge:
             logger.error(f"Erro ao remover URL manual: {e}")
             return False
 
-    def fetch_sitemap(self) -> Dict[KnowledgeSource, List[SitemapEntry]]:
+    async def fetch_sitemap(self) -> Dict[KnowledgeSource, List[SitemapEntry]]:
         """
-        Busca e processa o sitemap do site
+        Busca (via httpx, sem bloquear o event loop) e processa o sitemap do site
         
         Returns:
             Dict com URLs organizadas por fonte
@@ -190,28 +333,34 @@ class NeoGamesKnowledge:
         }
         
         try:
-            response = requests.get(self.sitemap_url)
-            response.raise_for_status()
-            tree = ET.fromstring(response.content)
-            ns = {"ns": "http://www.sitemaps.org/schemas/sitemap/0.9"}
+            async with httpx.AsyncClient(
+                http2=True,
+                timeout=self.fetch_timeout,
+                follow_redirects=True
+            ) as client:
+                response = await client.get(self.sitemap_url)
+                response.raise_for_status()
             
-            for url_elem in tree.findall("ns:url", ns):
+            # Parsing em streaming: cada <url> é lido ao fechar e descartado em seguida
+            for _, url_elem in etree.iterparse(
+                io.BytesIO(response.content), events=("end",), tag=_SITEMAP_URL_TAG
+            ):
                 try:
-                    loc = url_elem.find("ns:loc", ns).text.strip()
-                    lastmod_elem = url_elem.find("ns:lastmod", ns)
-                    priority_elem = url_elem.find("ns:priority", ns)
+                    loc = url_elem.findtext(_SITEMAP_LOC_TAG).strip()
+                    lastmod_text = url_elem.findtext(_SITEMAP_LASTMOD_TAG)
+                    priority_text = url_elem.findtext(_SITEMAP_PRIORITY_TAG)
                     
                     lastmod = None
-                    if lastmod_elem is not None and lastmod_elem.text:
+                    if lastmod_text:
                         try:
-                            lastmod = datetime.fromisoformat(lastmod_elem.text.replace('Z', '+00:00'))
+                            lastmod = datetime.fromisoformat(lastmod_text.replace('Z', '+00:00'))
                         except ValueError:
                             logger.warning(f"Formato de data inválido para {loc}")
                     
                     priority = 0.5
-                    if priority_elem is not None and priority_elem.text:
+                    if priority_text:
                         try:
-                            priority = float(priority_elem.text)
+                            priority = float(priority_text)
                         except ValueError:
                             logger.warning(f"Prioridade inválida para {loc}")
                     
@@ -220,32 +369,29 @@ class NeoGamesKnowledge:
                     parsed = urlparse(loc)
                     path = parsed.path.lower().strip("/")
                     
-                    if not path:
-                        organized[KnowledgeSource.MAIN].append(entry)
-                    elif path.startswith("news"):  # Removido /
-                        organized[KnowledgeSource.NEWS].append(entry)
-                    elif path.startswith("faq"):   # Removido /
-                        organized[KnowledgeSource.FAQ].append(entry)
-                    elif path.startswith("download"):  # Removido /
-                        organized[KnowledgeSource.DOWNLOAD].append(entry)
-                    elif path.startswith("system"):   # Removido /
-                        organized[KnowledgeSource.SYSTEM].append(entry)
-                    elif path.startswith("vip"):     # Removido /
-                        organized[KnowledgeSource.VIP].append(entry)
-                    elif path.startswith("shop"):    # Removido /
-                        organized[KnowledgeSource.SHOP].append(entry)
-                    elif path.startswith("recharge"): # Removido /
-                        organized[KnowledgeSource.RECHARGE].append(entry)
+                    source = (
+                        _SOURCE_BY_PATH_PREFIX.get(path.partition("/")[0])
+                        if path else KnowledgeSource.MAIN
+                    )
+                    if source is not None:
+                        organized[source].append(entry)
                     
                 except Exception as e:
                     logger.error(f"Erro ao processar entrada do sitemap: {e}")
                     continue
+                finally:
+                    # Libera o <url> processado e os irmãos anteriores da árvore parcial
+                    url_elem.clear()
+                    while url_elem.getprevious() is not None:
+                        del url_elem.getparent()[0]
             
             # Adiciona URLs manuais
             for source, urls in self.manual_urls.items():
                 logger.info(f"Processando URLs manuais para {source.value}")
+                seen = {entry.url for entry in organized[source]}
                 for url in urls:
-                    if not any(entry.url == url for entry in organized[source]):
+                    if url not in seen:
+                        seen.add(url)
                         logger.info(f"Adicionando URL manual: {url}")
                         organized[source].append(
                             SitemapEntry(
@@ -263,7 +409,8 @@ class NeoGamesKnowledge:
 
     async def load_content(self, source: KnowledgeSource, urls: List[str]) -> List[Document]:
         """
-        Carrega o conteúdo das URLs usando PlaywrightURLLoader
+        Carrega o conteúdo das URLs: primeiro por HTTP, em paralelo, e com
+        PlaywrightURLLoader apenas para as páginas que dependem de JS
         
         Args:
             source: Fonte do conhecimento
@@ -286,44 +433,31 @@ class NeoGamesKnowledge:
                 else:
                     absolute_urls.append(url)
             
-            loader = PlaywrightURLLoader(
-                urls=absolute_urls,
-                remove_selectors=[
-                    "nav", "footer", "header", ".modal",
-                    "script", "noscript", "style"
-                ]
-            )
-            documents = await loader.aload()
+            pages = await self._fetch_pages(absolute_urls)
             processed_docs = []
+            needs_js = []
             
-            for doc in documents:
-                try:
-                    soup = BeautifulSoup(doc.page_content, 'html.parser')
-                    for tag in soup.find_all(['script', 'style', 'nav', 'header', 'footer']):
-                        tag.decompose()
-                    
-                    main_content = (
-                        soup.find('main') or 
-                        soup.find('div', {'role': 'main'}) or 
-                        soup.find('div', class_=['content', 'main-content']) or
-                        soup
-                    )
-                    
-                    clean_content = main_content.get_text(separator=' ', strip=True)
-                    
-                    if clean_content:
-                        processed_docs.append(Document(
-                            page_content=clean_content,
-                            metadata={
-                                'source': source.value,
-                                'url': doc.metadata.get('source'),
-                                'timestamp': datetime.now().isoformat()
-                            }
-                        ))
-                        
-                except Exception as e:
-                    logger.error(f"Erro ao processar documento: {e}")
+            # Todas as páginas são processadas em paralelo no pool de parsing
+            contents = await asyncio.gather(
+                *(self._extract_text(pages[url]) if url in pages else self._no_content() for url in absolute_urls),
+                return_exceptions=True
+            )
+            
+            for url, clean_content in zip(absolute_urls, contents):
+                if isinstance(clean_content, Exception):
+                    logger.error(f"Erro ao processar documento: {clean_content}")
                     continue
+                
+                # HTML estático sem conteúdo suficiente: página montada via JS
+                if len(clean_content) < self.min_static_text_length:
+                    needs_js.append(url)
+                    continue
+                
+                processed_docs.append(self._make_document(source, url, clean_content))
+            
+            if needs_js:
+                logger.info(f"{len(needs_js)} páginas de {source.value} dependem de JS, carregando com Playwright")
+                processed_docs.extend(await self._load_with_playwright(source, needs_js))
                     
             return processed_docs
             
@@ -331,6 +465,82 @@ class NeoGamesKnowledge:
             logger.error(f"Erro ao carregar documentos: {e}")
             return []
 
+    async def _fetch_pages(self, urls: List[str]) -> Dict[str, str]:
+        """
+        Baixa o HTML das URLs com um único cliente HTTP (conexões keep-alive),
+        no máximo fetch_concurrency por vez. URLs com erro ficam de fora.
+        """
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
+        limits = httpx.Limits(
+            max_connections=self.fetch_concurrency,
+            max_keepalive_connections=self.fetch_concurrency
+        )
+        
+        async with httpx.AsyncClient(
+            http2=True,
+            limits=limits,
+            timeout=self.fetch_timeout,
+            follow_redirects=True
+        ) as client:
+            async def fetch(url: str) -> Tuple[str, Optional[str]]:
+                async with semaphore:
+                    try:
+                        response = await client.get(url)
+                        response.raise_for_status()
+                        return url, response.text
+                    except httpx.HTTPError as e:
+                        logger.warning(f"Erro ao baixar {url}: {e}")
+                        return url, None
+            
+            results = await asyncio.gather(*(fetch(url) for url in urls))
+        
+        return {url: html for url, html in results if html}
+
+    async def _load_with_playwright(self, source: KnowledgeSource, urls: List[str]) -> List[Document]:
+        """Carrega com navegador headless as páginas que só têm conteúdo após o JS."""
+        # HTML bruto: a limpeza é feita uma vez só, em extract_main_text
+        loader = PlaywrightURLLoader(urls=urls, evaluator=_RawHtmlEvaluator())
+        documents = await loader.aload()
+        processed_docs = []
+        
+        contents = await asyncio.gather(
+            *(self._extract_text(doc.page_content) for doc in documents),
+            return_exceptions=True
+        )
+        
+        for doc, clean_content in zip(documents, contents):
+            if isinstance(clean_content, Exception):
+                logger.error(f"Erro ao processar documento: {clean_content}")
+                continue
+            if clean_content:
+                processed_docs.append(
+                    self._make_document(source, doc.metadata.get('source'), clean_content)
+                )
+                
+        return processed_docs
+
+    async def _extract_text(self, html: str) -> str:
+        """Extrai o texto do conteúdo principal da página num processo do pool de parsing."""
+        if self._html_pool is None:
+            self._html_pool = _create_html_pool()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._html_pool, extract_main_text, html)
+
+    @staticmethod
+    async def _no_content() -> str:
+        return ""
+
+    @staticmethod
+    def _make_document(source: KnowledgeSource, url: Optional[str], content: str) -> Document:
+        return Document(
+            page_content=content,
+            metadata={
+                'source': source.value,
+                'url': url,
+                'timestamp': datetime.now().isoformat()
+            }
+        )
+
     def _prepare_bm25_index(self):
         """Prepara o índice BM25 com os documentos atuais"""
         try:
@@ -350,35 +560,113 @@ class NeoGamesKnowledge:
             
             # Preparar corpus para BM25
             tokenized_corpus = []
-            self.documents_for_bm25 = []
             
             for doc in documents:
                 # Tokenizar o texto em palavras
                 tokens = doc.page_content.lower().split()
                 tokenized_corpus.append(tokens)
-                self.documents_for_bm25.append(doc)
             
-            # Criar índice BM25
-            self.bm25_index = BM25Okapi(tokenized_corpus)
+            # Criar índice BM25 e só então publicar: consultas rodando em outras
+            # threads nunca veem a lista de documentos pela metade
+            bm25_index = BM25Okapi(tokenized_corpus)
+            # Fonte de cada documento, alinhada aos scores do BM25 (filtro vetorizado na busca)
+            sources = np.array([doc.metadata.get('source') for doc in documents], dtype=object)
+            self._bm25 = (bm25_index, documents, sources)
+            self._index_generation += 1
             logging.info("Índice BM25 preparado com sucesso")
                 
         except Exception as e:
             logging.error(f"Erro ao preparar índice BM25: {str(e)}", exc_info=True)
-            self.bm25_index = None
+            self._bm25 = None
 
-    def create_knowledge_base(self, documents: List[Document]):
+    def _optimize_index(self):
+        """
+        Converte o índice flat (float32) do vectorstore, mantendo a ordem de ids do docstore:
+        - até hnsw_min_vectors: IndexScalarQuantizer de 8 bits (busca exata, 1 byte por dimensão)
+        - acima disso: IndexHNSWSQ, busca aproximada sublinear sobre vetores também em 8 bits
+        """
         try:
-            if not documents:
-                logging.warning("Nenhum documento para criar base")
+            if not self.vectorstore:
                 return
-                    
-            logging.info(f"Iniciando split de {len(documents)} documentos")
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                separators=["\n\n", "\n", ". "]
+            index = self.vectorstore.index
+            if isinstance(index, faiss.IndexHNSW):
+                index.hnsw.efSearch = self.hnsw_ef_search
+                return
+            if not isinstance(index, faiss.IndexFlat) or index.ntotal == 0:
+                return
+
+            vectors = index.reconstruct_n(0, index.ntotal)
+            # Do índice flat a reconstrução é exata: vira a cópia float32 de referência
+            self._raw_vectors = vectors
+            if index.ntotal >= self.hnsw_min_vectors:
+                # Grafo HNSW com armazenamento int8: 4x menos memória/disco que o float32
+                optimized = faiss.IndexHNSWSQ(
+                    index.d, faiss.ScalarQuantizer.QT_8bit, self.hnsw_m, index.metric_type
+                )
+                optimized.hnsw.efConstruction = self.hnsw_ef_construction
+                optimized.hnsw.efSearch = self.hnsw_ef_search
+                optimized.train(vectors)
+                optimized.add(vectors)
+                logging.info(f"Índice HNSW int8 criado: {index.ntotal} vetores de {index.d} dimensões")
+            else:
+                optimized = faiss.IndexScalarQuantizer(
+                    index.d, faiss.ScalarQuantizer.QT_8bit, index.metric_type
+                )
+                optimized.train(vectors)
+                optimized.add(vectors)
+                logging.info(f"Índice quantizado para int8: {index.ntotal} vetores de {index.d} dimensões")
+            self.vectorstore.index = optimized
+        except Exception as e:
+            logging.error(f"Erro ao otimizar índice: {e}", exc_info=True)
+
+    def _split_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Divide os documentos em chunks e pós-processa o resultado: chunks acima de
+        max_chunk_length são redivididos e chunks vizinhos da mesma página são unidos
+        enquanto couberem em chunk_size (os menores que min_chunk_length, até
+        max_chunk_length). Menos trechos sem contexto e menos embeddings a gerar.
+        """
+        chunks: List[Document] = []
+        for split in self._text_splitter.split_documents(documents):
+            pieces = (
+                self._fallback_splitter.split_documents([split])
+                if len(split.page_content) > self.max_chunk_length else [split]
             )
-            splits = text_splitter.split_documents(documents)
+            for piece in pieces:
+                previous = chunks[-1] if chunks else None
+                if previous is not None and previous.metadata == piece.metadata:
+                    combined = self._join_chunks(previous.page_content, piece.page_content)
+                    small = min(len(previous.page_content), len(piece.page_content)) < self.min_chunk_length
+                    if len(combined) <= (self.max_chunk_length if small else self.chunk_size):
+                        previous.page_content = combined
+                        continue
+                chunks.append(piece)
+        return chunks
+
+    def _join_chunks(self, first: str, second: str) -> str:
+        """Concatena dois chunks vizinhos sem repetir o overlap que o splitter deixou entre eles."""
+        if second in first:
+            return first
+        # Overlaps curtos demais seriam coincidência, não texto repetido
+        for size in range(min(len(first), len(second), self.chunk_overlap), 20, -1):
+            if first.endswith(second[:size]):
+                return first + second[size:]
+        return f"{first}\n{second}"
+
+    def create_knowledge_base(self, documents: List[Document], kept_chunks: Optional[List[Document]] = None) -> bool:
+        """
+        Cria/atualiza a base com os documentos baixados mais os chunks já indexados
+        que continuam valendo (páginas inalteradas). Retorna True se a base ficou
+        consistente com esse conteúdo.
+        """
+        try:
+            kept_chunks = kept_chunks or []
+            if not documents and not kept_chunks:
+                logging.warning("Nenhum documento para criar base")
+                return False
+                    
+            logging.info(f"Iniciando split de {len(documents)} documentos ({len(kept_chunks)} chunks mantidos)")
+            splits = self._split_documents(documents) + kept_chunks
             logging.info(f"Split concluído: {len(splits)} chunks")
                 
             # Criar ou atualizar o vectorstore
@@ -391,27 +679,48 @@ class NeoGamesKnowledge:
                 mem = psutil.virtual_memory()
                 logging.info(f"Memória disponível: {mem.available / (1024 * 1024):.2f} MB")
                 
-                # Tentar criar em partes menores
-                batch_size = 30
-                all_splits = splits
-                if self.vectorstore is None:
-                    # Criar com primeiro batch
-                    first_batch = all_splits[:batch_size]
-                    logging.info(f"Criando vectorstore inicial com {len(first_batch)} documentos")
-                    self.vectorstore = FAISS.from_documents(first_batch, self.embeddings)
-                    
-                    # Adicionar resto em batches
-                    remaining = all_splits[batch_size:]
-                    for i in range(0, len(remaining), batch_size):
-                        batch = remaining[i:i + batch_size]
-                        logging.info(f"Adicionando batch de {len(batch)} documentos")
-                        self.vectorstore.add_documents(batch)
-                else:
-                    # Adicionar em batches
-                    for i in range(0, len(all_splits), batch_size):
-                        batch = all_splits[i:i + batch_size]
-                        logging.info(f"Adicionando batch de {len(batch)} documentos")
-                        self.vectorstore.add_documents(batch)
+                texts = [split.page_content for split in splits]
+                metadatas = [split.metadata for split in splits]
+                
+                # Nada mudou desde a última atualização: mantém o índice atual
+                previous_chunks = self._indexed_chunks()
+                if Counter(map(self._chunk_key, previous_chunks)) == Counter(map(self._chunk_key, splits)):
+                    logging.info("Conteúdo inalterado desde a última atualização, mantendo o vectorstore")
+                    if self._bm25 is None:
+                        self._prepare_bm25_index()
+                    return True
+                
+                # Chunks com texto já indexado reaproveitam o vetor do índice atual;
+                # só os novos/alterados passam pelo modelo de embeddings
+                vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+                known_positions = {doc.page_content: i for i, doc in enumerate(previous_chunks)}
+                previous_vectors = self._lossless_vectors() if known_positions else None
+                if previous_vectors is not None:
+                    for i, text in enumerate(texts):
+                        position = known_positions.get(text)
+                        if position is not None:
+                            vectors[i] = previous_vectors[position]
+                
+                missing = [i for i, vector in enumerate(vectors) if vector is None]
+                logging.info(f"{len(texts) - len(missing)} chunks reaproveitados, {len(missing)} para gerar embeddings")
+                # Ordenados por tamanho, cada lote junta chunks de comprimento parecido
+                # e quase não há padding; os vetores voltam para a posição original pelo índice
+                missing.sort(key=lambda i: len(texts[i]))
+                
+                # Gera os embeddings em poucas chamadas grandes (o modelo agrupa internamente)
+                for start in range(0, len(missing), self.embed_batch_size):
+                    batch = missing[start:start + self.embed_batch_size]
+                    logging.info(f"Gerando embeddings de {len(batch)} chunks ({start + len(batch)}/{len(missing)})")
+                    batch_vectors = self.embeddings.embed_documents([texts[i] for i in batch])
+                    for i, vector in zip(batch, batch_vectors):
+                        vectors[i] = np.asarray(vector, dtype=np.float32)
+                
+                # O índice é refeito do zero: páginas removidas saem e nada é duplicado
+                logging.info(f"Criando vectorstore com {len(texts)} documentos")
+                self.vectorstore = FAISS.from_embeddings(
+                    list(zip(texts, vectors)), self.embeddings, metadatas=metadatas
+                )
+                self._raw_vectors = np.vstack(vectors).astype(np.float32, copy=False)
                         
                 logging.info("Vectorstore atualizado com sucesso")
                     
@@ -419,62 +728,181 @@ class NeoGamesKnowledge:
                 logging.error(f"Erro na criação do vectorstore: {str(e)}", exc_info=True)
                 raise
                     
+            # Quantiza o índice ou monta o HNSW (no-op se já estiver otimizado)
+            self._optimize_index()
+
             # Salvar vectorstore
             logging.info("Salvando vectorstore")
-            self.vectorstore.save_local(self.vectorstore_dir)
+            self._save_vectorstore()
                 
             # Preparar índice BM25
             logging.info("Preparando índice BM25")
             self._prepare_bm25_index()
                 
             logging.info("Base de conhecimento atualizada com sucesso")
+            return True
                 
         except Exception as e:
             logging.error(f"Erro ao criar base: {str(e)}", exc_info=True, stack_info=True)
+            return False
+
+    def _save_vectorstore(self):
+        """
+        Salva o vectorstore num diretório temporário e só então o troca pelo atual:
+        uma escrita interrompida nunca deixa um índice corrompido no lugar do bom
+        (o que forçaria gerar todos os embeddings de novo).
+        """
+        tmp_dir = f"{self.vectorstore_dir}.new"
+        old_dir = f"{self.vectorstore_dir}.old"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.vectorstore.save_local(tmp_dir)
+        if self._raw_vectors is not None:
+            np.save(os.path.join(tmp_dir, _RAW_VECTORS_FILE), self._raw_vectors)
+
+        # Diretório não pode ser substituído por rename se já existir: o atual sai
+        # do caminho primeiro e só é apagado depois que o novo estiver no lugar
+        if self._has_saved_index(self.vectorstore_dir):
+            shutil.rmtree(old_dir, ignore_errors=True)
+            os.replace(self.vectorstore_dir, old_dir)
+        else:
+            # Vazio/incompleto: não há o que preservar, e um .old bom segue até o fim
+            shutil.rmtree(self.vectorstore_dir, ignore_errors=True)
+        os.replace(tmp_dir, self.vectorstore_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def _lossless_vectors(self) -> Optional[np.ndarray]:
+        """
+        Embeddings float32 do índice atual, na ordem das posições, ou None.
+        Índices 8 bits só devolvem vetores dequantizados: reaproveitá-los requantizaria
+        o erro a cada reconstrução, então sem a cópia float32 os chunks são embedados de novo.
+        """
+        if not self.vectorstore:
+            return None
+        index = self.vectorstore.index
+        if self._raw_vectors is not None and len(self._raw_vectors) == index.ntotal:
+            return self._raw_vectors
+        if isinstance(index, faiss.IndexFlat):
+            return index.reconstruct_n(0, index.ntotal)
+        return None
+
+    def _load_raw_vectors(self, vectorstore: FAISS) -> Optional[np.ndarray]:
+        """Lê a cópia float32 salva junto do índice; None se faltar ou não bater com ele."""
+        path = os.path.join(self.vectorstore_dir, _RAW_VECTORS_FILE)
+        if not os.path.isfile(path):
+            return None
+        vectors = np.load(path)
+        if len(vectors) != vectorstore.index.ntotal:
+            logging.warning("Vetores float32 salvos não correspondem ao índice, ignorando")
+            return None
+        return vectors
+
+    @staticmethod
+    def _has_saved_index(directory: str) -> bool:
+        return os.path.isfile(os.path.join(directory, "index.faiss"))
+
+    def _load_manifest(self) -> Dict[str, str]:
+        """URL -> lastmod (ISO) da última indexação; vazio se ainda não houver."""
+        try:
+            with open(self.manifest_path, 'rb') as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f"Manifest inválido, todas as páginas serão baixadas: {e}")
+            return {}
+
+    def _save_manifest(self, manifest: Dict[str, str]):
+        """Grava o manifest num arquivo temporário e troca de uma vez (nunca fica pela metade)."""
+        tmp_path = f"{self.manifest_path}.new"
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(manifest))
+        os.replace(tmp_path, self.manifest_path)
+
+    def _indexed_chunks(self) -> List[Document]:
+        """Documentos do vectorstore atual, na ordem das posições do índice FAISS."""
+        if not self.vectorstore:
+            return []
+        docstore = self.vectorstore.docstore._dict
+        id_map = self.vectorstore.index_to_docstore_id
+        return [docstore[id_map[i]] for i in range(self.vectorstore.index.ntotal)]
+
+    @staticmethod
+    def _chunk_key(doc: Document) -> Tuple[str, Optional[str], Optional[str]]:
+        return doc.page_content, doc.metadata.get('source'), doc.metadata.get('url')
+
+    def _semantic_search(
+        self,
+        question: str,
+        k: int,
+        embedding: Optional[List[float]] = None,
+        source_values: Optional[List[str]] = None
+    ) -> List[Document]:
+        """
+        Busca no FAISS, reaproveitando o embedding da pergunta quando já calculado.
+        Com source_values, o filtro por fonte é aplicado dentro da busca sobre os
+        fetch_k mais próximos, e não depois de cortar os k primeiros.
+        """
+        search_kwargs = {}
+        if source_values:
+            search_kwargs = {
+                'filter': {'source': source_values},
+                'fetch_k': max(20, k * self.semantic_fetch_factor)
+            }
+        if embedding is not None:
+            return self.vectorstore.similarity_search_by_vector(embedding, k=k, **search_kwargs)
+        return self.vectorstore.similarity_search(question, k=k, **search_kwargs)
+
+    @staticmethod
+    def _top_indices(scores: np.ndarray, n: int) -> np.ndarray:
+        """
+        Índices dos n maiores scores em ordem decrescente: seleção parcial O(len)
+        e ordenação apenas dos escolhidos, em vez de ordenar todos os scores.
+        """
+        n = min(n, len(scores))
+        if n <= 0:
+            return np.empty(0, dtype=np.intp)
+        top = np.argpartition(scores, -n)[-n:]
+        return top[np.argsort(scores[top])[::-1]]
 
-    def hybrid_search(self, question: str, k: int = 3, sources: Optional[List[KnowledgeSource]] = None):
+    def hybrid_search(
+        self,
+        question: str,
+        k: int = 3,
+        sources: Optional[List[KnowledgeSource]] = None,
+        embedding: Optional[List[float]] = None
+    ):
         """Realiza busca híbrida combinando BM25 e embeddings"""
         try:
-            if not self.vectorstore or not self.bm25_index:
+            # Uma leitura só: índice, documentos e fontes sempre da mesma versão
+            bm25 = self._bm25
+            if not self.vectorstore or bm25 is None:
                 return []
+            bm25_index, bm25_documents, bm25_sources = bm25
             
             # Filtrar por fonte antes da busca
             if sources:
                 source_values = [s.value for s in sources]
                 
-                # Busca semântica com FAISS
-                semantic_results = self.vectorstore.similarity_search(
-                    question, 
-                    k=k*2
-                )
-                
-                # Filtrar resultados FAISS por fonte
-                filtered_semantic = [
-                    doc for doc in semantic_results 
-                    if isinstance(doc, Document) and doc.metadata.get('source') in source_values
-                ]
+                # Busca semântica com FAISS, já filtrada por fonte
+                filtered_semantic = self._semantic_search(question, k*2, embedding, source_values)
                 
                 # Busca e filtro BM25
                 tokenized_query = question.lower().split()
-                bm25_scores = self.bm25_index.get_scores(tokenized_query)
+                bm25_scores = bm25_index.get_scores(tokenized_query)
                 
-                # Filtrar resultados BM25
-                bm25_results = []
-                for idx in bm25_scores.argsort()[::-1]:
-                    doc = self.documents_for_bm25[idx]
-                    if isinstance(doc, Document) and doc.metadata.get('source') in source_values:
-                        bm25_results.append(doc)
-                    if len(bm25_results) >= k*2:
-                        break
+                # Filtrar resultados BM25: máscara das fontes pedidas e top-k só entre elas
+                candidates = np.flatnonzero(np.isin(bm25_sources, source_values))
+                top_indices = candidates[self._top_indices(bm25_scores[candidates], k*2)]
+                bm25_results = [bm25_documents[i] for i in top_indices]
             else:
                 # Busca sem filtro
-                semantic_results = self.vectorstore.similarity_search(question, k=k*2)
+                semantic_results = self._semantic_search(question, k*2, embedding)
                 filtered_semantic = semantic_results
                 
                 tokenized_query = question.lower().split()
-                bm25_scores = self.bm25_index.get_scores(tokenized_query)
-                top_indices = bm25_scores.argsort()[-k*2:][::-1]
-                bm25_results = [self.documents_for_bm25[i] for i in top_indices]
+                bm25_scores = bm25_index.get_scores(tokenized_query)
+                top_indices = self._top_indices(bm25_scores, k*2)
+                bm25_results = [bm25_documents[i] for i in top_indices]
             
             # Combinar resultados
             combined_results = []
@@ -502,39 +930,56 @@ class NeoGamesKnowledge:
             return []
 
     async def initialize(self):
-        """Inicializa a base de conhecimento"""
-        try:
-            logger.info("Inicializando base de conhecimento do NeoGames...")
-            
-            # Tenta carregar base existente
-            if os.path.exists(self.vectorstore_dir):
-                try:
-                    self.vectorstore = FAISS.load_local(
-                        self.vectorstore_dir,
-                        self.embeddings,
-                        allow_dangerous_deserialization=True
-                    )
-                    logger.info("Base de conhecimento existente carregada")
-                except Exception as e:
-                    logger.warning(f"Erro ao carregar base existente: {e}")
-                    self.vectorstore = None
-            
-            # Atualiza a base
-            await self.update_knowledge_bases()
-            
-            # Inicia monitoramento
-            self._monitor_task = asyncio.create_task(self._monitor_updates())
-            
-        except Exception as e:
-            logger.error(f"Erro na inicialização da base: {str(e)}")
-            raise
+        """
+        Inicializa a base de conhecimento sem bloquear o startup: o índice salvo
+        só é carregado na primeira consulta (ou pelo monitor), e a atualização
+        do site roda em background.
+        """
+        logger.info("Inicializando base de conhecimento do NeoGames...")
+        self._monitor_task = asyncio.create_task(self._monitor_updates())
+
+    async def _ensure_loaded(self):
+        """Carrega o vectorstore salvo em disco uma única vez, mesmo com consultas concorrentes."""
+        if self.vectorstore is not None or self._load_failed:
+            return
+        async with self._load_lock:
+            if self.vectorstore is not None or self._load_failed:
+                return
+            # Troca interrompida entre os dois renames de _save_vectorstore: volta o índice anterior
+            old_dir = f"{self.vectorstore_dir}.old"
+            if not self._has_saved_index(self.vectorstore_dir) and self._has_saved_index(old_dir):
+                shutil.rmtree(self.vectorstore_dir, ignore_errors=True)
+                os.replace(old_dir, self.vectorstore_dir)
+                logger.warning("Índice restaurado do backup de uma gravação interrompida")
+            if not self._has_saved_index(self.vectorstore_dir):
+                return
+            try:
+                # Leitura/desserialização do índice em thread, fora do event loop
+                vectorstore = await asyncio.to_thread(
+                    FAISS.load_local,
+                    self.vectorstore_dir,
+                    self.embeddings,
+                    allow_dangerous_deserialization=True
+                )
+                self._raw_vectors = await asyncio.to_thread(self._load_raw_vectors, vectorstore)
+                self.vectorstore = vectorstore
+                logger.info("Base de conhecimento existente carregada")
+                # Bases salvas antes da otimização ainda usam o índice flat
+                await asyncio.to_thread(self._optimize_index)
+                await asyncio.to_thread(self._prepare_bm25_index)
+            except Exception as e:
+                logger.warning(f"Erro ao carregar base existente: {e}")
+                self.vectorstore = None
+                self._load_failed = True
 
     async def _monitor_updates(self):
-        """Monitora atualizações periodicamente"""
+        """Atualiza a base ao iniciar e depois periodicamente"""
         while True:
             try:
-                await asyncio.sleep(3600 * 6)  # A cada 6 horas
+                # A atualização reaproveita os vetores do índice salvo
+                await self._ensure_loaded()
                 await self.update_knowledge_bases()
+                await asyncio.sleep(3600 * 6)  # A cada 6 horas
             except asyncio.CancelledError:
                 break
             except Exception as e:
@@ -542,59 +987,131 @@ class NeoGamesKnowledge:
                 await asyncio.sleep(60)
 
     async def shutdown(self):
-        """Desliga corretamente o monitoramento"""
+        """Desliga corretamente o monitoramento e o pool de parsing"""
         if self._monitor_task:
             self._monitor_task.cancel()
             try:
                 await self._monitor_task
             except asyncio.CancelledError:
                 pass
+        if self._html_pool:
+            self._html_pool.shutdown(wait=False, cancel_futures=True)
+            self._html_pool = None
 
     async def update_knowledge_bases(self):
         try:
-            sitemap_entries = self.fetch_sitemap()
-            all_documents = []
+            sitemap_entries = await self.fetch_sitemap()
             
             # Adicionar logs para debug
             logger.info("Iniciando atualização das bases")
             
-            for source in KnowledgeSource:
-                entries = sitemap_entries.get(source, [])
-                logger.info(f"Source {source.value}: {len(entries)} entradas do sitemap")
-                
-                if not entries:
-                    logger.warning(f"Nenhuma entrada para {source.value}")
+            # Páginas com o mesmo lastmod da última indexação não são baixadas de novo:
+            # os chunks delas que já estão no índice seguem para a nova base
+            manifest = await asyncio.to_thread(self._load_manifest)
+            indexed_by_url: Dict[Optional[str], List[Document]] = {}
+            for doc in self._indexed_chunks():
+                indexed_by_url.setdefault(doc.metadata.get('url'), []).append(doc)
+            
+            sources = list(KnowledgeSource)
+            to_crawl: Dict[KnowledgeSource, List[SitemapEntry]] = {}
+            kept_chunks: List[Document] = []
+            for source in sources:
+                to_crawl[source] = []
+                for entry in sitemap_entries.get(source, []):
+                    lastmod = entry.lastmod.isoformat() if entry.lastmod else None
+                    if lastmod and manifest.get(entry.url) == lastmod and entry.url in indexed_by_url:
+                        kept_chunks.extend(indexed_by_url[entry.url])
+                    else:
+                        to_crawl[source].append(entry)
+            logger.info(
+                f"{sum(map(len, to_crawl.values()))} URLs novas/alteradas para baixar, "
+                f"{len(kept_chunks)} chunks de páginas inalteradas mantidos"
+            )
+            
+            # As fontes são carregadas em paralelo; cada uma isola os próprios erros
+            results = await asyncio.gather(
+                *(self._load_source_documents(source, to_crawl[source]) for source in sources),
+                return_exceptions=True
+            )
+            
+            all_documents = []
+            for source, result in zip(sources, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Erro ao carregar {source.value}: {result}")
                     continue
-                    
-                urls = [entry.url for entry in entries]
-                
-                # Adiciona URLs manuais
-                manual_urls = self.manual_urls.get(source, [])
-                if manual_urls:
-                    logger.info(f"Adicionando {len(manual_urls)} URLs manuais para {source.value}")
-                    urls.extend(manual_urls)
-                
-                # Remove duplicatas mantendo a ordem
-                urls = list(dict.fromkeys(urls))
-                logger.info(f"Total de {len(urls)} URLs para {source.value}: {urls}")
-                
-                # Carrega documentos
-                documents = await self.load_content(source, urls)
-                logger.info(f"Carregados {len(documents)} documentos para {source.value}")
-                all_documents.extend(documents)
+                all_documents.extend(result)
             
             logger.info(f"Total de {len(all_documents)} documentos carregados")
             
-            # Cria/atualiza a base unificada
-            self.create_knowledge_base(all_documents)
+            # A base é refeita do zero: URL tentada que não rendeu documento (erro HTTP,
+            # falha do navegador, fonte inteira com exceção) mantém os chunks já indexados,
+            # em vez de sumir da base por uma falha passageira
+            loaded_urls = {doc.metadata.get('url') for doc in all_documents}
+            failed_urls = {
+                entry.url
+                for entries in to_crawl.values()
+                for entry in entries
+                if entry.url not in loaded_urls
+            }
+            for url in failed_urls:
+                kept_chunks.extend(indexed_by_url.get(url, []))
+            if failed_urls:
+                logger.warning(f"{len(failed_urls)} URLs sem conteúdo nesta atualização mantêm os chunks anteriores")
+            
+            # Cria/atualiza a base unificada: embeddings, quantização e save_local
+            # são síncronos e pesados, então rodam em thread
+            if not await asyncio.to_thread(self.create_knowledge_base, all_documents, kept_chunks):
+                return
+            
+            # Só depois da base salva: registra o lastmod das páginas que estão no índice.
+            # As que falharam ficam de fora para serem baixadas de novo no próximo ciclo
+            indexed_urls = {doc.metadata.get('url') for doc in self._indexed_chunks()}
+            await asyncio.to_thread(self._save_manifest, {
+                entry.url: entry.lastmod.isoformat()
+                for entries in sitemap_entries.values()
+                for entry in entries
+                if entry.lastmod and entry.url in indexed_urls and entry.url not in failed_urls
+            })
                 
         except Exception as e:
             logger.error(f"Erro ao atualizar bases: {e}")
 
-    def query(self, question: str, sources: Optional[List[KnowledgeSource]] = None, k: int = 3) -> str:
+    async def _load_source_documents(self, source: KnowledgeSource, entries: List[SitemapEntry]) -> List[Document]:
+        """Carrega os documentos de uma fonte (URLs do sitemap + URLs manuais)."""
+        logger.info(f"Source {source.value}: {len(entries)} entradas do sitemap")
+        
+        if not entries:
+            logger.warning(f"Nenhuma entrada para {source.value}")
+            return []
+            
+        urls = [entry.url for entry in entries]
+        
+        # Adiciona URLs manuais
+        manual_urls = self.manual_urls.get(source, [])
+        if manual_urls:
+            logger.info(f"Adicionando {len(manual_urls)} URLs manuais para {source.value}")
+            urls.extend(manual_urls)
+        
+        # Remove duplicatas mantendo a ordem
+        urls = list(dict.fromkeys(urls))
+        logger.info(f"Total de {len(urls)} URLs para {source.value}: {urls}")
+        
+        # Carrega documentos, no máximo source_concurrency fontes por vez
+        async with self._source_semaphore:
+            documents = await self.load_content(source, urls)
+        logger.info(f"Carregados {len(documents)} documentos para {source.value}")
+        return documents
+
+    def query(
+        self,
+        question: str,
+        sources: Optional[List[KnowledgeSource]] = None,
+        k: int = 3,
+        embedding: Optional[List[float]] = None
+    ) -> str:
         try:
             if not self.vectorstore:
-                return "Base de conhecimento não inicializada."
+                return NOT_INITIALIZED_MESSAGE
 
             # Log para debug
             logging.info(f"Consultando base de conhecimento para: {question}")
@@ -603,7 +1120,9 @@ class NeoGamesKnowledge:
                 logging.info(f"Buscando apenas nas fontes: {source_values}")
 
             # Fazer busca híbrida já com filtro de sources
-            docs = self.hybrid_search(question, k=k, sources=sources)
+            if embedding is None:
+                embedding = self.embed_query_cached(question)
+            docs = self.hybrid_search(question, k=k, sources=sources, embedding=embedding)
             logging.info(f"Encontrados {len(docs)} documentos")
 
             if not docs:
@@ -640,10 +1159,107 @@ class NeoGamesKnowledge:
                 
         except Exception as e:
             logging.error(f"Erro na consulta: {e}")
-            return "Erro ao consultar a base de conhecimento."
+            return QUERY_ERROR_MESSAGE
+
+
+    @staticmethod
+    def _embedding_key(question: str) -> str:
+        return " ".join(question.split())
+
+    def _get_cached_embedding(self, question: str) -> Optional[np.ndarray]:
+        key = self._embedding_key(question)
+        with self._query_embeddings_lock:
+            vector = self._query_embeddings.get(key)
+            if vector is not None:
+                self._query_embeddings.move_to_end(key)
+            return vector
+
+    def _cache_embedding(self, question: str, vector: List[float]) -> np.ndarray:
+        # float32 contíguo: ~4KB por pergunta, contra ~32KB de uma lista de floats
+        vector = np.asarray(vector, dtype=np.float32)
+        key = self._embedding_key(question)
+        with self._query_embeddings_lock:
+            self._query_embeddings[key] = vector
+            self._query_embeddings.move_to_end(key)
+            while len(self._query_embeddings) > self.query_embedding_cache_size:
+                self._query_embeddings.popitem(last=False)
+        return vector
+
+    def embed_query_cached(self, question: str) -> np.ndarray:
+        """Embedding da pergunta, reaproveitando o cache quando ela se repete."""
+        vector = self._get_cached_embedding(question)
+        if vector is None:
+            vector = self._cache_embedding(question, self.embeddings.embed_query(question))
+        return vector
+
+    async def _aembed_query(self, question: str) -> List[float]:
+        """Enfileira a pergunta; a fila é embedada em lote ao fim da janela."""
+        vector = self._get_cached_embedding(question)
+        if vector is not None:
+            return vector
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._embed_queue.append((question, future))
+        if len(self._embed_queue) == 1:
+            task = loop.create_task(self._flush_embed_queue())
+            self._embed_flush_tasks.add(task)
+            task.add_done_callback(self._embed_flush_tasks.discard)
+        return await future
+
+    async def _flush_embed_queue(self):
+        """Ao fim da janela, gera numa única passada os embeddings de todas as perguntas enfileiradas."""
+        await asyncio.sleep(self.embed_batch_window)
+        batch, self._embed_queue = self._embed_queue, []
+        if not batch:
+            return
+        try:
+            vectors = await asyncio.to_thread(
+                self.embeddings.embed_documents, [question for question, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        if len(batch) > 1:
+            logger.debug(f"Embeddings de {len(batch)} perguntas gerados em lote")
+        for (question, future), vector in zip(batch, vectors):
+            vector = self._cache_embedding(question, vector)
+            if not future.done():
+                future.set_result(vector)
+
+    async def aquery(self, question: str, sources: Optional[List[KnowledgeSource]] = None, k: int = 3) -> str:
+        """
+        Versão assíncrona de query para uso nas tools do agente.
+        O embedding da pergunta é agrupado com o das consultas concorrentes, e a
+        busca (FAISS + BM25) é síncrona, então roda em thread para não travar o event loop.
+        Perguntas repetidas são respondidas do cache até a próxima reconstrução da base.
+        """
+        cache_key = (
+            self._index_generation,
+            self._embedding_key(question),
+            tuple(source.value for source in sources) if sources else None,
+            k
+        )
+        cached = self._query_results.get(cache_key)
+        if cached is not None:
+            return cached
+
+        await self._ensure_loaded()
+        embedding = None
+        if self.vectorstore:
+            try:
+                embedding = await self._aembed_query(question)
+            except Exception as e:
+                logging.error(f"Erro ao gerar embedding da consulta: {e}")
+        response = await asyncio.to_thread(self.query, question, sources, k, embedding)
 
+        # Só guarda respostas de uma base pronta, e nunca mensagens de erro
+        if self._bm25 is not None and response != QUERY_ERROR_MESSAGE:
+            self._query_results.set(cache_key, response)
+        return response
 
-    def get_all_urls(self) -> Dict[KnowledgeSource, List[str]]:
+    async def get_all_urls(self) -> Dict[KnowledgeSource, List[str]]:
         """
         Retorna todas as URLs conhecidas, incluindo manuais e do sitemap
         
@@ -652,7 +1268,7 @@ class NeoGamesKnowledge:
         """
         try:
             all_urls = {source: [] for source in KnowledgeSource}
-            sitemap_entries = self.fetch_sitemap()
+            sitemap_entries = await self.fetch_sitemap()
             
             for source in KnowledgeSource:
                 # URLs do sitemap
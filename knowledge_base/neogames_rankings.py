@@ -1,15 +1,18 @@
 #knowledge_base/ranking_neogames.py
 import os
+import re
 import asyncio
 import logging
 from enum import Enum
 from typing import List, Dict, Optional, Union, Tuple
 from dataclasses import dataclass
 from datetime import datetime
-import json
+import orjson
 import time
 from pathlib import Path
+import soupsieve as sv
 from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 
 from langchain_core.documents import Document
@@ -104,6 +107,21 @@ CLASS_MAPPING = {
     }
 }
 
+# Abreviação em minúsculas (nomes de pastas, arquivos e tools), calculada uma única vez
+for _class_info in CLASS_MAPPING.values():
+    _class_info['short_lower'] = _class_info['short'].lower()
+del _class_info
+
+# Ícone da classe (como aparece no srcset das imagens) -> informações da classe.
+# Uma única busca de regex substitui o teste de cada classe com "in"
+_CLASS_BY_ICON = {info['icon']: info for info in CLASS_MAPPING.values()}
+_CLASS_ICON_RE = re.compile(r"icon-(" + "|".join(map(re.escape, _CLASS_BY_ICON)) + r")")
+
+def _class_from_srcset(srcset: str) -> Optional[Dict]:
+    """Identifica a classe pelo srcset da imagem do ícone; None se não reconhecer."""
+    match = _CLASS_ICON_RE.search(srcset)
+    return _CLASS_BY_ICON[match.group(1)] if match else None
+
 # Mapeamento de nações
 NATION_MAPPING = {
     'icon-procyon': {
@@ -120,6 +138,18 @@ NATION_MAPPING = {
     }
 }
 
+# Seletores CSS compilados uma única vez (e não a cada card/linha)
+_MEMORIAL_CARD_SELECTOR = sv.compile('div.rounded-md.border-2.text-card-foreground')
+_MEMORIAL_NAME_SELECTOR = sv.compile('h2.font-bold')
+_MEMORIAL_GUILD_SELECTOR = sv.compile('p.text-muted-foreground')
+_CLASS_ICON_SELECTOR = sv.compile('img[alt^="Icon"]')
+_PROCYON_IMG_SELECTOR = sv.compile('img[srcset*="procyon.png"]')
+_CAPELLA_IMG_SELECTOR = sv.compile('img[srcset*="capella.png"]')
+
+def _cell_text(cell) -> str:
+    """Texto de uma célula lxml, equivalente ao get_text(strip=True) do BeautifulSoup."""
+    return ''.join(text.strip() for text in cell.itertext())
+
 class NeoGamesRankings:
     def __init__(self, base_dir: str = "knowledge_base/ranking"):
         self.base_dir = base_dir
@@ -160,6 +190,9 @@ class NeoGamesRankings:
         'kd_ratio': 'K/D',
         'nation': 'Nação'
     }        
+        # Respostas formatadas por arquivo: (json_path, tipo, query_type) -> ((mtime_ns, tamanho), texto)
+        self._response_cache: Dict[Tuple[str, str, Optional[str]], Tuple[Tuple[int, int], str]] = {}
+
         self._setup_directories()
 
     def _setup_directories(self):
@@ -175,7 +208,7 @@ class NeoGamesRankings:
             if ranking_type == 'power':
                 os.makedirs(os.path.join(path, "general"), exist_ok=True)
                 for class_info in CLASS_MAPPING.values():
-                    os.makedirs(os.path.join(path, class_info['short'].lower()), exist_ok=True)
+                    os.makedirs(os.path.join(path, class_info['short_lower']), exist_ok=True)
 
 
     async def fetch_page_content(self, url: str, wait_selector='table', timeout=30000) -> str:
@@ -333,28 +366,21 @@ class NeoGamesRankings:
         """
         logger.info("Analisando dados do ranking de power")
         
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Linha a linha direto na árvore do lxml: células, ícones e textos saem de xpath
+        tree = lxml_html.fromstring(html_content)
         power_data = []
         
         try:
-            rows = soup.find_all('tr')[1:]  # Pula o cabeçalho
+            rows = tree.xpath('//tr')[1:]  # Pula o cabeçalho
             
             for position, row in enumerate(rows, 1):
                 try:
-                    cells = row.find_all(['td'])
+                    cells = row.xpath('.//td')
                     if len(cells) >= 7:
-                        # Identifica a classe
+                        # Identifica a classe pela primeira imagem da célula
                         class_cell = cells[1]
-                        class_info = None
-                        
-                        # Tenta encontrar a imagem da classe
-                        class_img = class_cell.find('img')
-                        if class_img and 'srcset' in class_img.attrs:
-                            srcset = class_img['srcset']
-                            for class_id, info in CLASS_MAPPING.items():
-                                if f"icon-{info['icon']}" in srcset:
-                                    class_info = info
-                                    break
+                        class_srcset = class_cell.xpath('string((.//img)[1]/@srcset)')
+                        class_info = _class_from_srcset(class_srcset) if class_srcset else None
                         
                         # Se não encontrou a classe, usa valor padrão
                         if not class_info:
@@ -363,11 +389,11 @@ class NeoGamesRankings:
                                 'name_pt': 'Desconhecida',
                                 'short': 'UNK'
                             }
-                            logger.debug(f"Classe não identificada para posição {position}. HTML da célula: {class_cell}")
+                            logger.debug(f"Classe não identificada para posição {position}. HTML da célula: {lxml_html.tostring(class_cell, encoding='unicode')}")
                         
-                        # Identifica a nação
-                        nation_cell = cells[7] if len(cells) >= 8 else None
-                        nation_info = self.get_nation_info(nation_cell) if nation_cell else {
+                        # Identifica a nação pelo srcset do ícone
+                        nation_srcset = cells[7].xpath('string((.//img)[1]/@srcset)') if len(cells) >= 8 else ''
+                        nation_info = self.get_nation_info(nation_srcset) if nation_srcset else {
                             'name': 'Unknown',
                             'name_pt': 'Desconhecida'
                         }
@@ -379,11 +405,11 @@ class NeoGamesRankings:
                                 'pt': class_info['name_pt'],
                                 'short': class_info['short']
                             },
-                            'name': cells[2].get_text(strip=True),
-                            'guild': cells[3].get_text(strip=True),
-                            'attack_power': self.parse_value(cells[4].get_text(strip=True)),
-                            'defense_power': self.parse_value(cells[5].get_text(strip=True)),
-                            'total_power': self.parse_value(cells[6].get_text(strip=True)),
+                            'name': _cell_text(cells[2]),
+                            'guild': _cell_text(cells[3]),
+                            'attack_power': self.parse_value(_cell_text(cells[4])),
+                            'defense_power': self.parse_value(_cell_text(cells[5])),
+                            'total_power': self.parse_value(_cell_text(cells[6])),
                             'nation': {
                                 'en': nation_info['name'],
                                 'pt': nation_info['name_pt']
@@ -414,23 +440,24 @@ class NeoGamesRankings:
         """
         logger.info("Analisando dados do ranking de guild")
         
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Tabela só de texto: lida direto na árvore do lxml, sem montar a do BeautifulSoup
+        tree = lxml_html.fromstring(html_content)
         guild_data = []
         
         try:
-            rows = soup.find_all('tr')[1:]  # Pula o cabeçalho
+            rows = tree.xpath('//tr')[1:]  # Pula o cabeçalho
             
             for position, row in enumerate(rows, 1):
                 try:
-                    cells = row.find_all(['td'])
+                    cells = [_cell_text(cell) for cell in row.xpath('.//td')]
                     if len(cells) >= 6:
                         guild_entry = {
                             'position': position,
-                            'name': cells[1].get_text(strip=True),
-                            'power': self.parse_value(cells[2].get_text(strip=True)),
-                            'members': self.parse_value(cells[3].get_text(strip=True)),
-                            'war_points': self.parse_value(cells[4].get_text(strip=True)),
-                            'war_kills': self.parse_value(cells[5].get_text(strip=True))
+                            'name': cells[1],
+                            'power': self.parse_value(cells[2]),
+                            'members': self.parse_value(cells[3]),
+                            'war_points': self.parse_value(cells[4]),
+                            'war_kills': self.parse_value(cells[5])
                         }
                         guild_data.append(guild_entry)
                 except Exception as e:
@@ -449,30 +476,25 @@ class NeoGamesRankings:
         """
         logger.info("Analisando dados do ranking memorial")
         
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = BeautifulSoup(html_content, 'lxml')
         memorial_data = []
         
         try:
-            cards = soup.select('div.rounded-md.border-2.text-card-foreground')
+            cards = _MEMORIAL_CARD_SELECTOR.select(soup)
             
             for position, card in enumerate(cards, 1):
                 try:
-                    character_name = card.select_one('h2.font-bold').get_text(strip=True)
-                    guild_name = card.select_one('p.text-muted-foreground').get_text(strip=True)
+                    character_name = _MEMORIAL_NAME_SELECTOR.select_one(card).get_text(strip=True)
+                    guild_name = _MEMORIAL_GUILD_SELECTOR.select_one(card).get_text(strip=True)
                     
                     # Nova lógica de identificação de classe
-                    class_icon = card.select_one('img[alt^="Icon"]')
+                    class_icon = _CLASS_ICON_SELECTOR.select_one(card)
                     class_info = None
                     
                     if class_icon:
                         # Tenta identificar pelo srcset
                         if 'srcset' in class_icon.attrs:
-                            srcset = class_icon['srcset']
-                            for class_id, info in CLASS_MAPPING.items():
-                                icon_pattern = f"icon-{info['icon']}"
-                                if icon_pattern in srcset:
-                                    class_info = info
-                                    break
+                            class_info = _class_from_srcset(class_icon['srcset'])
                         
                         # Se não achou pelo srcset, tenta pelo alt
                         if not class_info and 'alt' in class_icon.attrs:
@@ -492,13 +514,13 @@ class NeoGamesRankings:
                         logger.debug(f"Classe não identificada para {character_name}. HTML do ícone: {class_icon}")
                     
                     # Usando a mesma lógica do power.py para nação
-                    nation_img = card.select_one('img[srcset*="procyon.png"]')
+                    nation_img = _PROCYON_IMG_SELECTOR.select_one(card)
                     nation_info = None
                     
                     if nation_img:
                         nation_info = NATION_MAPPING['icon-procyon']
                     else:
-                        nation_img = card.select_one('img[srcset*="capella.png"]')
+                        nation_img = _CAPELLA_IMG_SELECTOR.select_one(card)
                         if nation_img:
                             nation_info = NATION_MAPPING['icon-capella']
                     
@@ -548,7 +570,7 @@ class NeoGamesRankings:
         """
         logger.info("Analisando dados do ranking de war e pontuação semanal")
         
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = BeautifulSoup(html_content, 'lxml')
         war_roles_data = []
         weekly_scores_data = []
         
@@ -568,6 +590,8 @@ class NeoGamesRankings:
                 
                 # Tabela de Guardiões/Portadores
                 if len(header_cells) == 4:
+                    # A nação é da tabela inteira: detecta uma vez, não a cada linha
+                    nation = self._detect_table_nation(table)
                     for row in data_rows:
                         try:
                             cells = row.find_all(['td'])
@@ -577,11 +601,7 @@ class NeoGamesRankings:
                                 class_info = None
                                 
                                 if class_img and 'srcset' in class_img.attrs:
-                                    srcset = class_img['srcset']
-                                    for class_id, info in CLASS_MAPPING.items():
-                                        if f"icon-{info['icon']}" in srcset:
-                                            class_info = info
-                                            break
+                                    class_info = _class_from_srcset(class_img['srcset'])
                                 
                                 if not class_info:
                                     class_info = {
@@ -594,48 +614,6 @@ class NeoGamesRankings:
                                 type_cell = cells[3]
                                 role_type = 'Portador' if 'text-brand' in type_cell.get('class', []) else 'Guardião'
                                 
-                                # CORREÇÃO DA DETECÇÃO DE NAÇÃO
-                                nation = None
-                                # 1. Tenta encontrar pelo ícone com srcset, considerando ambos os formatos de imagem
-                                nation_img = table.find_previous('img', srcset=lambda x: any(pattern in x.lower() if x else False 
-                                                                        for pattern in ['icon-procyon', 'procyon-main.png']))
-                                if nation_img:
-                                    nation = NATION_MAPPING['icon-procyon']
-                                else:
-                                    nation_img = table.find_previous('img', srcset=lambda x: any(pattern in x.lower() if x else False 
-                                                                            for pattern in ['icon-capella', 'capella-main.png']))
-                                    if nation_img:
-                                        nation = NATION_MAPPING['icon-capella']
-
-                                # 2. Se não encontrou, procura pelo container pai
-                                if not nation:
-                                    nation_container = table.find_previous(['div', 'section'], class_=lambda x: x and 'rounded-md' in x if x else False)
-                                    if nation_container:
-                                        img = nation_container.find('img', srcset=lambda x: any(pattern in x.lower() if x else False 
-                                                                            for pattern in ['procyon-main.png', 'capella-main.png']))
-                                        if img:
-                                            if 'procyon-main.png' in img['srcset'].lower():
-                                                nation = NATION_MAPPING['icon-procyon']
-                                            elif 'capella-main.png' in img['srcset'].lower():
-                                                nation = NATION_MAPPING['icon-capella']
-
-                                # 3. Se ainda não encontrou, procura por texto
-                                if not nation:
-                                    section = table.find_previous(['section', 'div'])
-                                    if section:
-                                        text = section.get_text().lower()
-                                        if 'procyon' in text:
-                                            nation = NATION_MAPPING['icon-procyon']
-                                        elif 'capella' in text:
-                                            nation = NATION_MAPPING['icon-capella']
-
-                                # 4. Fallback para Unknown se nada for encontrado
-                                if not nation:
-                                    nation = {
-                                        'name': 'Unknown',
-                                        'name_pt': 'Desconhecida'
-                                    }
-                                
                                 entry = {
                                     'name': cells[1].get_text(strip=True),
                                     'class': {
@@ -674,11 +652,7 @@ class NeoGamesRankings:
                                 class_info = None
                                 class_img = cells[1].find('img')
                                 if class_img and 'srcset' in class_img.attrs:
-                                    srcset = class_img['srcset']
-                                    for class_id, info in CLASS_MAPPING.items():
-                                        if f"icon-{info['icon']}" in srcset:
-                                            class_info = info
-                                            break
+                                    class_info = _class_from_srcset(class_img['srcset'])
                                 
                                 if not class_info:
                                     class_info = {
@@ -745,6 +719,54 @@ class NeoGamesRankings:
             logger.error(f"Erro ao analisar rankings de war: {e}")
             raise
 
+    def _detect_table_nation(self, table) -> Dict:
+        """
+        Identifica a nação de uma tabela de Guardiões/Portadores pelo
+        ícone/container/texto que a antecede no HTML.
+        """
+        nation = None
+        # 1. Tenta encontrar pelo ícone com srcset, considerando ambos os formatos de imagem
+        nation_img = table.find_previous('img', srcset=lambda x: any(pattern in x.lower() if x else False 
+                                                for pattern in ['icon-procyon', 'procyon-main.png']))
+        if nation_img:
+            nation = NATION_MAPPING['icon-procyon']
+        else:
+            nation_img = table.find_previous('img', srcset=lambda x: any(pattern in x.lower() if x else False 
+                                                    for pattern in ['icon-capella', 'capella-main.png']))
+            if nation_img:
+                nation = NATION_MAPPING['icon-capella']
+
+        # 2. Se não encontrou, procura pelo container pai
+        if not nation:
+            nation_container = table.find_previous(['div', 'section'], class_=lambda x: x and 'rounded-md' in x if x else False)
+            if nation_container:
+                img = nation_container.find('img', srcset=lambda x: any(pattern in x.lower() if x else False 
+                                                    for pattern in ['procyon-main.png', 'capella-main.png']))
+                if img:
+                    if 'procyon-main.png' in img['srcset'].lower():
+                        nation = NATION_MAPPING['icon-procyon']
+                    elif 'capella-main.png' in img['srcset'].lower():
+                        nation = NATION_MAPPING['icon-capella']
+
+        # 3. Se ainda não encontrou, procura por texto
+        if not nation:
+            section = table.find_previous(['section', 'div'])
+            if section:
+                text = section.get_text().lower()
+                if 'procyon' in text:
+                    nation = NATION_MAPPING['icon-procyon']
+                elif 'capella' in text:
+                    nation = NATION_MAPPING['icon-capella']
+
+        # 4. Fallback para Unknown se nada for encontrado
+        if not nation:
+            nation = {
+                'name': 'Unknown',
+                'name_pt': 'Desconhecida'
+            }
+        return nation
+
+
     def save_ranking_data(self, data: Union[List[Dict], Dict[str, List[Dict]]], ranking_type: str, class_id: Optional[int] = None):
         """
         Salva os dados do ranking apenas em JSON.
@@ -759,9 +781,10 @@ class NeoGamesRankings:
                     class_info = CLASS_MAPPING.get(class_id, {
                         'name': 'Unknown',
                         'name_pt': 'Desconhecida',
-                        'short': 'UNK'
+                        'short': 'UNK',
+                        'short_lower': 'unk'
                     })
-                    subfolder = class_info['short'].lower()
+                    subfolder = class_info['short_lower']
                 else:
                     subfolder = "general"
                 out_dir = os.path.join(self.base_dir, ranking_type, subfolder)
@@ -780,8 +803,7 @@ class NeoGamesRankings:
                         'rankings': data['war_roles']
                     }
                     roles_path = os.path.join(out_dir, 'ranking_roles.json')
-                    with open(roles_path, 'w', encoding='utf-8') as f:
-                        json.dump(roles_data, f, ensure_ascii=False, indent=2)
+                    self._write_json(roles_path, roles_data)
                 
                 # Salva os dados de pontuação semanal
                 if 'weekly_scores' in data:
@@ -791,8 +813,7 @@ class NeoGamesRankings:
                         'rankings': data['weekly_scores']
                     }
                     weekly_path = os.path.join(out_dir, 'ranking_weekly.json')
-                    with open(weekly_path, 'w', encoding='utf-8') as f:
-                        json.dump(weekly_data, f, ensure_ascii=False, indent=2)
+                    self._write_json(weekly_path, weekly_data)
             else:
                 # Nome do arquivo JSON baseado no tipo e subpasta
                 if ranking_type == 'power':
@@ -809,8 +830,7 @@ class NeoGamesRankings:
                     'rankings': data
                 }
                 
-                with open(json_path, 'w', encoding='utf-8') as f:
-                    json.dump(output_data, f, ensure_ascii=False, indent=2)
+                self._write_json(json_path, output_data)
                 
                 logger.info(f"Dados JSON atualizados em: {json_path}")
                 
@@ -818,6 +838,12 @@ class NeoGamesRankings:
             logger.error(f"Erro ao salvar ranking: {e}")
             raise
         
+    @staticmethod
+    def _write_json(path: str, payload: Dict) -> None:
+        """Salva o JSON com orjson (UTF-8, indentado para continuar legível no disco)."""
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+
     def _log_top_entries(self, entries: List[Dict], ranking_type: str):
         """
         Função auxiliar para logar os primeiros colocados.
@@ -883,22 +909,13 @@ class NeoGamesRankings:
                     # Pega o JSON correto para outros tipos de ranking
                     json_path = self._get_json_path(ranking_type, class_abbr)
                 
-                # Se existe o arquivo
-                if os.path.exists(json_path):
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    # Pega os rankings
-                    rankings = data.get('rankings', [])
-                    if rankings:
-                        # Passa o query_type para o format_ranking_response
-                        response = self.format_ranking_response(
-                            rankings, 
-                            ranking_type,
-                            query_type=query_type if ranking_type == 'war' else None
-                        )
-                        if response:
-                            responses.append(response)
+                response = self._get_ranking_response(
+                    json_path,
+                    ranking_type,
+                    query_type if ranking_type == 'war' else None
+                )
+                if response:
+                    responses.append(response)
 
             # Se encontrou algum ranking, retorna
             if responses:
@@ -910,6 +927,50 @@ class NeoGamesRankings:
             logger.error(f"Erro consultando rankings: {e}")
             return ""
 
+    def _get_ranking_response(self, json_path: str, ranking_type: str, query_type: Optional[str]) -> str:
+        """
+        Resposta formatada de um arquivo de ranking. O resultado fica em memória
+        e só é refeito quando o arquivo muda (mtime/tamanho), em vez de ler e
+        formatar o JSON a cada consulta.
+        """
+        try:
+            stat = os.stat(json_path)
+        except FileNotFoundError:
+            return ""
+
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = (json_path, ranking_type, query_type)
+        cached = self._response_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        with open(json_path, 'rb') as f:
+            data = orjson.loads(f.read())
+
+        # Pega os rankings
+        rankings = data.get('rankings', [])
+        response = ""
+        if rankings:
+            # Passa o query_type para o format_ranking_response
+            response = self.format_ranking_response(rankings, ranking_type, query_type=query_type)
+
+        self._response_cache[key] = (stamp, response)
+        return response
+
+    async def aquery(self, question: str, ranking_types: Optional[List[str]] = None, k: int = 3, class_abbr: Optional[str] = None, query_type: Optional[str] = None) -> str:
+        """
+        Versão assíncrona de query para uso nas tools do agente.
+        A leitura dos JSONs é I/O de disco bloqueante, então roda em thread.
+        """
+        return await asyncio.to_thread(
+            self.query,
+            question,
+            ranking_types=ranking_types,
+            k=k,
+            class_abbr=class_abbr,
+            query_type=query_type
+        )
+
     def format_ranking_response(self, rankings: List[Dict], ranking_type: str, query_type: Optional[str] = None) -> str:
         """
         Formata os rankings de forma amigável
@@ -1089,7 +1150,7 @@ class NeoGamesRankings:
                 class_abbr = class_abbr.upper()
                 for _, info in CLASS_MAPPING.items():
                     if info['short'] == class_abbr:
-                        subfolder = class_abbr.lower()
+                        subfolder = info['short_lower']
                         return os.path.join(self.base_dir, ranking_type, subfolder, f"ranking_{subfolder}.json")
             else:
                 # Para o ranking geral, usa 'general' no nome do arquivo
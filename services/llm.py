@@ -3,6 +3,7 @@ import logging
 from typing import Optional, Dict, Any
 from dataclasses import dataclass
 
+import httpx
 from langchain_openai import ChatOpenAI
 from langchain_groq import ChatGroq
 from langchain_anthropic import ChatAnthropic
@@ -21,6 +22,8 @@ class LLMConfig:
 class OpenAIConfig(LLMConfig):
     """Configuração específica para OpenAI."""
     model: str = OPENAI_MODEL
+    max_connections: int = 64
+    max_keepalive_connections: int = 32
     
 @dataclass
 class GroqConfig(LLMConfig):
@@ -67,7 +70,15 @@ class LLMManager:
                     model=self.openai_config.model,
                     temperature=self.openai_config.temperature,
                     max_retries=self.openai_config.max_retries,
-                    request_timeout=self.openai_config.request_timeout
+                    request_timeout=self.openai_config.request_timeout,
+                    # Pool HTTP/2 persistente: invocações concorrentes reaproveitam as conexões
+                    http_async_client=httpx.AsyncClient(
+                        http2=True,
+                        limits=httpx.Limits(
+                            max_connections=self.openai_config.max_connections,
+                            max_keepalive_connections=self.openai_config.max_keepalive_connections
+                        )
+                    )
                 )
             except Exception as e:
                 logger.error(f"Erro ao inicializar OpenAI: {e}")
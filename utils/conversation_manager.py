@@ -1,8 +1,10 @@
 # utils/conversation_manager.py
 import logging
 import time
-from typing import Dict, List, Optional
+from collections import defaultdict, deque
+from typing import Deque, Dict, Optional, Tuple
 from dataclasses import dataclass, field
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -21,57 +23,67 @@ class LeadContext:
     phone: str
     timestamp: float = field(default_factory=time.time)
 
+# Caracteres removidos do número, numa única passada de str.translate
+_PHONE_STRIP_TABLE = str.maketrans("", "", "+()- ")
+
+@lru_cache(maxsize=4096)
+def _normalize_phone(phone_number: str) -> str:
+    """Normalização do número; o mesmo remetente se repete, então o resultado fica em cache."""
+    # 1. Primeiro limpa todos os caracteres especiais
+    phone = phone_number.strip().replace("@c.us", "").translate(_PHONE_STRIP_TABLE)
+    
+    # 2. Remove qualquer "55" do início para evitar duplicação
+    while phone.startswith("55"):
+        phone = phone[2:]
+    
+    # 3. Adiciona o prefixo 55 uma única vez
+    phone = "55" + phone
+    
+    # 4. Adiciona 9 após DDD se necessário (para números de 8 dígitos)
+    if len(phone) == 12:  # 55 + DDD + 8 dígitos
+        phone = phone[:4] + "9" + phone[4:]
+    
+    logger.debug("Número normalizado de %s para %s", phone_number, phone)
+    return phone
+
 class ConversationManager:
     """Gerencia o histórico das conversas."""
+
+    # Limite de mensagens guardadas por conversa
+    MAX_MESSAGES = 50
+    # Quantas mensagens recentes entram no contexto do agente
+    TAIL_SIZE = 3
+    # Limite de caracteres de cada mensagem no contexto do agente
+    TAIL_MESSAGE_MAX_CHARS = 600
     
     def __init__(self):
-        self._conversations: Dict[str, List[Message]] = {}
+        # deque com maxlen: inserção O(1) e descarte automático das mais antigas
+        self._conversations: Dict[str, Deque[Message]] = defaultdict(
+            lambda: deque(maxlen=self.MAX_MESSAGES)
+        )
         self._lead_context: Dict[str, LeadContext] = {}
+        # Últimas TAIL_SIZE mensagens já formatadas e unidas, refeitas só no add_message
+        self._joined_tail: Dict[str, str] = {}
     
     def normalize_phone(self, phone_number: str) -> str:
         """
         Padroniza o formato do número de telefone.
         Remove caracteres especiais e garante o formato correto.
         """
-        # 1. Primeiro limpa todos os caracteres especiais
-        phone = phone_number.strip()
-        phone = phone.replace("+", "")
-        phone = phone.replace("@c.us", "")
-        phone = phone.replace("(", "").replace(")", "")
-        phone = phone.replace("-", "").replace(" ", "")
-        
-        # 2. Remove qualquer "55" do início para evitar duplicação
-        while phone.startswith("55"):
-            phone = phone[2:]
-        
-        # 3. Adiciona o prefixo 55 uma única vez
-        if not phone.startswith("55"):
-            phone = "55" + phone
-        
-        # 4. Adiciona 9 após DDD se necessário (para números de 8 dígitos)
-        if len(phone) == 12:  # 55 + DDD + 8 dígitos
-            ddd = phone[2:4]
-            numero = phone[4:]
-            phone = "55" + ddd + "9" + numero
-        
-        logger.debug(f"Número normalizado de {phone_number} para {phone}")
-        return phone
+        return _normalize_phone(phone_number)
         
     def add_message(self, number: str, content: str, role: str = 'assistant') -> None:
         """Adiciona uma mensagem ao histórico."""
         number = self.normalize_phone(number)
-        if number not in self._conversations:
-            self._conversations[number] = []
-            
         self._conversations[number].append(Message(
             role=role,
             content=content,
             timestamp=time.time()
         ))
-        
-        # Limite de 50 mensagens por conversa
-        if len(self._conversations[number]) > 50:
-            self._conversations[number] = self._conversations[number][-50:]
+        self._joined_tail[number] = "\n".join(
+            self._shorten(text, self.TAIL_MESSAGE_MAX_CHARS)
+            for text in self.get_recent(number, self.TAIL_SIZE)
+        )
             
         logger.debug(f"Mensagem adicionada para {number}. Total: {len(self._conversations[number])}")
 
@@ -110,9 +122,9 @@ class ConversationManager:
             
             # Adiciona mensagens
             if number in self._conversations:
-                for msg in self._conversations[number]:
-                    role = "Livia" if msg.role == 'assistant' else "Cliente"
-                    history_parts.append(f"{role}: {msg.content}")
+                history_parts.extend(
+                    self._format_message(msg) for msg in self._conversations[number]
+                )
                 logger.debug(f"Adicionadas {len(self._conversations[number])} mensagens ao histórico para {number}")
             
             full_history = "\n".join(history_parts)
@@ -123,6 +135,35 @@ class ConversationManager:
             logger.error(f"Erro ao obter histórico: {e}")
             return ""
         
+    def get_recent(self, number: str, k: int = 3) -> Tuple[str, ...]:
+        """Retorna apenas as últimas k mensagens já formatadas, sem montar o histórico completo."""
+        number = self.normalize_phone(number)
+        messages = self._conversations.get(number)
+        if not messages:
+            return ()
+        start = max(len(messages) - k, 0)
+        return tuple(
+            self._format_message(messages[i]) for i in range(start, len(messages))
+        )
+
+    def get_recent_text(self, number: str) -> str:
+        """Retorna as últimas TAIL_SIZE mensagens formatadas numa única string ('' se não houver)."""
+        return self._joined_tail.get(self.normalize_phone(number), "")
+
+    @staticmethod
+    def _shorten(text: str, limit: int) -> str:
+        """Corta textos longos mantendo o começo e o fim, onde costuma estar o essencial."""
+        if len(text) <= limit:
+            return text
+        half = (limit - 5) // 2
+        return f"{text[:half]} [...] {text[-half:]}"
+
+    @staticmethod
+    def _format_message(msg: Message) -> str:
+        """Formata uma mensagem no padrão usado pelo agente."""
+        role = "Livia" if msg.role == 'assistant' else "Cliente"
+        return f"{role}: {msg.content}"
+
     def clear_history(self, number: str) -> None:
         """Limpa o histórico de um número específico."""
         number = self.normalize_phone(number)
@@ -130,6 +171,7 @@ class ConversationManager:
             del self._conversations[number]
         if number in self._lead_context:
             del self._lead_context[number]
+        self._joined_tail.pop(number, None)
         logger.debug(f"Histórico limpo para {number}")
 
     def get_lead_context(self, number: str) -> Optional[LeadContext]:
@@ -4,7 +4,7 @@ import asyncio
 import logging
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, field
-from agents.agent_setup import agent_executor
+from agents.agent_setup import get_agent_manager
 from utils.smart_message_processor import send_message_in_chunks
 from utils.conversation_manager import conversation_manager  # Adicionado import
 
@@ -14,29 +14,43 @@ logger = logging.getLogger(__name__)
 # Dicionário global para armazenar o status de presença e últimas atividades
 presence_status: Dict[str, Dict[str, Any]] = {}
 
+# Status que indicam que o usuário ainda está escrevendo/gravando
+_ACTIVE_PRESENCES = frozenset({"recording", "composing"})
+
 def update_presence(number: str, presence_data: Dict[str, Any]) -> None:
     """
     Atualiza o status de presença de um número baseado no webhook recebido.
     Armazena também o timestamp da última atualização.
     """
-    try:
-        normalized_number = number.split('@')[0]
-        last_known = presence_data.get("lastKnownPresence", "available")
-        
-        presence_status[normalized_number] = {
-            "status": last_known,
-            "last_update": time.time()
-        }
-        
-        logger.debug(f"Status de presença atualizado para {normalized_number}: {last_known}")
-        
-        # Atualiza o timestamp do buffer se necessário
-        from utils.message_buffer import message_buffer
-        if normalized_number in message_buffer._message_buffer and last_known in {"recording", "composing"}:
-            message_buffer._message_buffer[normalized_number]["last_activity"] = time.time()
-            logger.debug(f"Timestamp do buffer atualizado para {normalized_number}")
-    except Exception as e:
-        logger.error(f"Erro ao atualizar presença: {e}")
+    update_presence_bulk({number: presence_data})
+
+def update_presence_bulk(presences: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Atualiza de uma vez o status de presença de todos os números de um
+    evento presence.update (JID -> dados de presença).
+    """
+    from utils.message_buffer import message_buffer
+    buffers = message_buffer._message_buffer
+    now = time.time()
+
+    for jid, presence_data in presences.items():
+        # Um item malformado não impede a atualização dos demais
+        try:
+            normalized_number = jid.partition('@')[0]
+            last_known = presence_data.get("lastKnownPresence", "available")
+
+            presence_status[normalized_number] = {
+                "status": last_known,
+                "last_update": now
+            }
+
+            # Atualiza o timestamp do buffer se necessário
+            if last_known in _ACTIVE_PRESENCES and normalized_number in buffers:
+                buffers[normalized_number]["last_activity"] = now
+        except Exception as e:
+            logger.error(f"Erro ao atualizar presença de {jid}: {e}")
+
+    logger.debug("Status de presença atualizado para %d números", len(presences))
 
 async def is_user_available(number: str) -> bool:
     """
@@ -190,7 +204,7 @@ class MessageBuffer:
             history = conversation_manager.get_history(number)
             
             # Usar await com ainvoke
-            result = await agent_executor.ainvoke({
+            result = await get_agent_manager().executor.ainvoke({
                 "input": message,
                 "history": history
             })
@@ -0,0 +1,96 @@
+# utils/semantic_cache.py
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _CacheEntry:
+    """Resposta guardada junto com o embedding normalizado da pergunta."""
+    namespace: str
+    vector: np.ndarray
+    response: str
+    expires_at: float
+
+class SemanticCache:
+    """
+    Cache de respostas por similaridade semântica da pergunta.
+    Perguntas parecidas (cosseno >= threshold) no mesmo namespace
+    reaproveitam a resposta já gerada, sem passar pelo agente.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], List[float]],
+        threshold: float = 0.92,
+        ttl: float = 3600,
+        max_entries: int = 512
+    ):
+        """
+        Args:
+            embed_fn: Função que gera o embedding de um texto
+            threshold: Similaridade mínima para considerar um acerto
+            ttl: Tempo de vida de cada resposta, em segundos
+            max_entries: Número máximo de respostas guardadas
+        """
+        self._embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Ordem de inserção = ordem de expiração (TTL fixo)
+        self._entries: Deque[_CacheEntry] = deque()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normaliza caixa e espaços para que variações triviais gerem o mesmo embedding."""
+        return " ".join(text.lower().split())
+
+    def embed(self, text: str) -> np.ndarray:
+        """Gera o embedding normalizado (norma 1) do texto. Síncrono: use em thread."""
+        vector = np.asarray(self._embed_fn(self.normalize(text)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now: float) -> None:
+        while self._entries and self._entries[0].expires_at <= now:
+            self._entries.popleft()
+
+    def get(self, vector: np.ndarray, namespace: str = "") -> Optional[str]:
+        """Retorna a resposta mais similar do namespace, se passar do threshold."""
+        self._expire(time.monotonic())
+
+        best_response = None
+        best_score = self.threshold
+        for entry in self._entries:
+            if entry.namespace != namespace:
+                continue
+            score = float(np.dot(entry.vector, vector))
+            if score >= best_score:
+                best_score = score
+                best_response = entry.response
+
+        if best_response is not None:
+            logger.debug(f"Cache semântico: acerto com similaridade {best_score:.3f}")
+        return best_response
+
+    def put(self, vector: np.ndarray, response: str, namespace: str = "") -> None:
+        """Guarda a resposta; descarta as mais antigas ao passar de max_entries."""
+        now = time.monotonic()
+        self._expire(now)
+        self._entries.append(_CacheEntry(
+            namespace=namespace,
+            vector=vector,
+            response=response,
+            expires_at=now + self.ttl
+        ))
+        while len(self._entries) > self.max_entries:
+            self._entries.popleft()
+
+    def clear(self) -> None:
+        """Remove todas as respostas guardadas."""
+        self._entries.clear()
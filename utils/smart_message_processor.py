@@ -3,7 +3,7 @@ import random
 import asyncio
 import logging
 import os
-from typing import List, Optional
+from typing import AsyncGenerator, List, Optional
 from dataclasses import dataclass
 from langchain.prompts import PromptTemplate
 
@@ -23,6 +23,7 @@ class MessageProcessorConfig:
     question_pause: float = 1  # segundos
     exclamation_pause: float = 0.8  # segundos
     default_pause: float = 0.5 # segundos
+    stream_min_chunk_size: int = 200  # caracteres acumulados antes de enviar um trecho
 
 class SmartMessageProcessor:
     """Processador inteligente de mensagens."""
@@ -165,6 +166,62 @@ class SmartMessageProcessor:
             logger.error(f"Erro no envio: {e}", exc_info=True)
             return False
 
+    async def send_stream(self, parts: AsyncGenerator[str, None], number: str) -> bool:
+        """
+        Envia uma resposta que chega em pedaços (streaming), parágrafo a parágrafo,
+        sem esperar o texto completo. Parágrafos curtos são agrupados até
+        stream_min_chunk_size.
+        """
+        buffer = ""
+        pending: List[str] = []
+        sent_any = False
+
+        async def _flush() -> bool:
+            nonlocal sent_any
+            chunk = "\n\n".join(pending)
+            pending.clear()
+            if sent_any:
+                await asyncio.sleep(self._calculate_pause(chunk))
+            success = await self.client.send_message(
+                text=chunk,
+                number=number,
+                delay=self.calculate_typing_delay(len(chunk)),
+                simulate_typing=True
+            )
+            sent_any = True
+            if not success:
+                logger.error("Falha ao enviar trecho da resposta")
+            return success
+
+        try:
+            async for part in parts:
+                buffer += part
+                while True:
+                    cut = buffer.find("\n\n")
+                    if cut < 0:
+                        break
+                    paragraph, buffer = buffer[:cut].strip(), buffer[cut + 2:]
+                    if paragraph:
+                        pending.append(paragraph)
+                    if pending and sum(map(len, pending)) >= self.config.stream_min_chunk_size:
+                        if not await _flush():
+                            return False
+
+            if buffer.strip():
+                pending.append(buffer.strip())
+            if pending:
+                return await _flush()
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro no envio em streaming: {e}", exc_info=True)
+            return False
+
+        finally:
+            # Fecha o gerador mesmo quando o envio para no meio: o finally dele
+            # (que salva o histórico) roda agora, e não só no garbage collector
+            await parts.aclose()
+
 # Cria instância do processador
 whatsapp_client = create_whatsapp_client(
     api_key=os.getenv("EVOLUTION_API_KEY"),
@@ -177,4 +234,8 @@ message_processor = SmartMessageProcessor(whatsapp_client)
 # Função de interface para manter compatibilidade
 async def send_message_in_chunks(text: str, number: str) -> bool:
     """Função de interface para envio de mensagens."""
-    return await message_processor.send_message(text, number)
\ No newline at end of file
+    return await message_processor.send_message(text, number)
+
+async def send_stream_in_chunks(parts: AsyncGenerator[str, None], number: str) -> bool:
+    """Função de interface para envio de respostas em streaming."""
+    return await message_processor.send_stream(parts, number)
@@ -0,0 +1,51 @@
+# utils/ttl_cache.py
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+class TTLCache(Generic[V]):
+    """
+    Cache LRU com tempo de vida por entrada.
+    Ao passar de maxsize, descarta a entrada usada há mais tempo.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 60):
+        """
+        Args:
+            maxsize: Número máximo de entradas
+            ttl: Tempo de vida de cada entrada, em segundos
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        """Retorna o valor se existir e não tiver expirado."""
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        """Guarda o valor, renovando o tempo de vida."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        """Remove todas as entradas."""
+        self._data.clear()